@@ -0,0 +1,196 @@
+"""Admission control for the expensive analytics endpoints
+
+Every guarded route belongs to a cost class. A request is admitted in
+three steps:
+
+* **rate** – each client (remote address) has a token bucket per route,
+  refilled at the class's rate; an empty bucket is a 429;
+* **deduplication** – an identical request (method, path, query and body)
+  already running is joined instead of repeated, and its response is
+  shared with every caller that arrived while it ran;
+* **concurrency** – new computations hold one of the class's slots; when
+  they are all taken the request is a 429 rather than a queued thread.
+
+429 responses carry ``Retry-After``: the time until the bucket has a
+token again, or the class's typical run time when it is saturated.
+``ADMISSION_CONTROL=0`` turns the checks off (deduplication stays on).
+"""
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from flask import current_app, jsonify, request
+
+from instrumentation import registry
+
+ADMISSION_REJECTIONS = registry.counter(
+    'causal_admission_rejections_total', 'Requests refused with 429 by route and reason')
+ADMISSION_SHARED = registry.counter(
+    'causal_admission_shared_total', 'Requests answered with the result of an identical in-flight request')
+ADMISSION_IN_FLIGHT = registry.gauge(
+    'causal_admission_in_flight', 'Admitted computations running per endpoint class')
+ADMISSION_WAITING = registry.gauge(
+    'causal_admission_waiting', 'Requests waiting for an identical in-flight computation per endpoint class')
+
+
+@dataclass(frozen=True)
+class EndpointClass:
+    """Limits for one cost class: requests per second and burst per client and route, plus a concurrency cap"""
+    
+    rate: float
+    burst: float
+    concurrency: int
+
+
+DEFAULT_CLASSES = {
+    # Refit models over the whole store
+    'training': EndpointClass(rate=1 / 30, burst=2, concurrency=1),
+    # Score, cluster or scan the whole store
+    'analytics': EndpointClass(rate=0.2, burst=3, concurrency=2),
+    # One problem or one forecast against the saved models
+    'model': EndpointClass(rate=2.0, burst=10, concurrency=4)
+}
+
+# Per-client buckets kept before the least recently used are dropped
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+    
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+    
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Spend one token; returns 0 on success, else the seconds until one is available"""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class _Flight:
+    """One running computation and the callers waiting for its response"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[Tuple[bytes, int, list]] = None
+        self.error: Optional[BaseException] = None
+
+
+class AdmissionControl:
+    """Per-client rate limits, per-class concurrency caps and sharing of identical in-flight requests"""
+    
+    def __init__(self, classes: Optional[Dict[str, EndpointClass]] = None, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.environ.get('ADMISSION_CONTROL', '1') != '0'
+        self.classes = dict(classes or DEFAULT_CLASSES)
+        self.enabled = enabled
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._flights: Dict[Tuple[Any, ...], _Flight] = {}
+        self._running: Dict[str, int] = dict.fromkeys(self.classes, 0)
+        self._waiting: Dict[str, int] = dict.fromkeys(self.classes, 0)
+        # Smoothed run time per class, the Retry-After hint when it is saturated
+        self._duration: Dict[str, float] = dict.fromkeys(self.classes, 1.0)
+        self._lock = threading.Lock()
+    
+    def admit(self, cost_class: str):
+        """Decorator guarding a view with the limits of ``cost_class``"""
+        limits = self.classes[cost_class]
+        
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return self._handle(cost_class, limits, view, args, kwargs)
+            return wrapper
+        return decorator
+    
+    def _handle(self, cost_class: str, limits: EndpointClass, view, args, kwargs):
+        route = request.url_rule.rule if request.url_rule else request.path
+        now = time.monotonic()
+        
+        if self.enabled:
+            wait = self._take_token((request.remote_addr or 'unknown', route), limits, now)
+            if wait:
+                return self._reject(route, 'rate', wait, 'Rate limit exceeded')
+        
+        key = (request.method, request.full_path, request.get_data())
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                if self.enabled and self._running[cost_class] >= limits.concurrency:
+                    wait = self._duration[cost_class]
+                    flight = None
+                else:
+                    flight = self._flights[key] = _Flight()
+                    self._running[cost_class] += 1
+            else:
+                self._waiting[cost_class] += 1
+                waiting = self._waiting[cost_class]
+        
+        if flight is None:
+            return self._reject(route, 'concurrency', wait, 'Too many concurrent requests of this kind')
+        if not leader:
+            ADMISSION_SHARED.inc(route=route)
+            ADMISSION_WAITING.set(waiting, cost_class=cost_class)
+            return self._follow(cost_class, flight)
+        return self._lead(cost_class, key, flight, view, args, kwargs)
+    
+    def _take_token(self, bucket_key: Tuple[str, str], limits: EndpointClass, now: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = TokenBucket(limits.burst, now)
+                while len(self._buckets) > MAX_BUCKETS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(bucket_key)
+            return bucket.take(limits.rate, limits.burst, now)
+    
+    def _lead(self, cost_class: str, key, flight: _Flight, view, args, kwargs):
+        ADMISSION_IN_FLIGHT.set(self._running[cost_class], cost_class=cost_class)
+        started = time.monotonic()
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+            flight.response = (response.get_data(), response.status_code, list(response.headers.items()))
+            return response
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                self._running[cost_class] -= 1
+                self._duration[cost_class] = 0.8 * self._duration[cost_class] + 0.2 * (time.monotonic() - started)
+                running = self._running[cost_class]
+            ADMISSION_IN_FLIGHT.set(running, cost_class=cost_class)
+            flight.done.set()
+    
+    def _follow(self, cost_class: str, flight: _Flight):
+        flight.done.wait()
+        with self._lock:
+            self._waiting[cost_class] -= 1
+            waiting = self._waiting[cost_class]
+        ADMISSION_WAITING.set(waiting, cost_class=cost_class)
+        if flight.error is not None:
+            raise flight.error
+        body, status, headers = flight.response
+        return current_app.response_class(body, status=status, headers=headers)
+    
+    @staticmethod
+    def _reject(route: str, reason: str, wait: float, message: str):
+        ADMISSION_REJECTIONS.inc(route=route, reason=reason)
+        retry_after = max(1, math.ceil(wait))
+        response = jsonify({'error': message, 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
@@ -1,59 +1,176 @@
+# Select the serving mode first: eventlet/gevent must patch the stdlib before anything imports it
+import compute_pool
+compute_pool.monkey_patch()
+
+import click
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-import json
-import os
-from datetime import datetime
+from datetime import date, datetime
 import uuid
 import threading
-import time
 from ml_models import CausalLoopMLModels
-from predictive_models import PredictiveAnalytics
+from predictive_models import PredictiveAnalytics, forecast_horizon
+from metrics_store import MetricsLog, store_totals
+from graph_analytics import GraphAnalytics
+from layout import DiagramLayout
+from search_index import SearchIndex
+from derived_metrics import backfill_derived, problem_shape_error, with_derived
+from compact_model import DERIVED_COLUMNS, ProblemStore, file_stamp
+import instrumentation
+import serialization
+from serialization import conditional_read
+from compute_pool import ASYNC_MODE, ComputePool, run_blocking
+import batch_compute
+from admission import AdmissionControl
+from instrumentation import timed
+from json_patch import (JsonPatchConflict, JsonPatchError, apply_patch, is_position_independent,
+                        normalize_patch, parse_pointer, touched_paths)
 
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+serialization.init_app(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, json=serialization.SocketIOJSON)
+instrumentation.init_app(app, socketio)
 
 # Data storage
 DATA_FILE = 'causal_data.json'
+METRICS_DB = 'metrics_log.db'
+PREDICTIVE_MODELS_FILE = 'predictive_models.joblib'
+
+# Server-managed fields that clients may not patch
+PROTECTED_FIELDS = ('id', 'created_at', 'updated_at', 'version', 'derived', 'batch_scores')
+
+# Serializes every read-modify-write cycle against the data file (and the
+# metrics log and search index updates that go with it); reentrant because
+# a reload noticed inside a write runs the reload callbacks, which take it too
+data_lock = threading.RLock()
 
 # Initialize ML models
 ml_models = CausalLoopMLModels()
 predictive_models = PredictiveAnalytics()
+graph_analytics = GraphAnalytics()
+diagram_layout = DiagramLayout()
 
 # Load existing models if available
 ml_models.load_models()
 predictive_models.load_models()
 
+# Rate limits, concurrency caps and deduplication for the routes that run models
+admission = AdmissionControl()
+
+# CPU-heavy model, graph and simulation calls; runs inline unless COMPUTE_WORKERS > 0
+compute = ComputePool({'ml': ml_models, 'predictive': predictive_models, 'graph': graph_analytics,
+                       'layout': diagram_layout,
+                       'batch': batch_compute.BatchJobs(ml_models, predictive_models)})
+instrumentation.registry.gauge('causal_compute_queue_depth', 'Calls waiting for an idle compute worker',
+                               callback=lambda: compute.waiting)
+
+def _read_json(path):
+    with open(path, 'rb') as f:
+        return serialization.loads(f.read())
+
+def _write_json(path, data):
+    # Compact output: the file is read by this app, not by people
+    _write_bytes(path, serialization.dumps(data))
+
+def _write_bytes(path, payload):
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+# Compact in-memory copy of the data file; dicts are built only when handed out
+problem_store = ProblemStore()
+
+def problem_records():
+    """The compact store, re-parsed only when the data file changed on disk"""
+    # File I/O runs on a native thread in the eventlet/gevent serving modes
+    return problem_store.sync(DATA_FILE, lambda: run_blocking(_read_json, DATA_FILE))
+
+@timed('load_data')
 def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {"problems": []}
+    return problem_records().to_data()
+
+def problem_summaries():
+    """Scalars and derived blocks of every problem, all that training, clustering and scoring read"""
+    return problem_records().summaries()
 
+def find_problem(problem_id):
+    """One problem as a dict, without materializing the rest of the store"""
+    record = problem_records().get(problem_id)
+    return record.to_dict() if record else None
+
+def _problem_etag(problem_id):
+    record = problem_records().get(problem_id)
+    return record.etag(serialization.dumps) if record else None
+
+def _forecast_etag():
+    # Forecasts depend only on the saved models, the horizon and the current day
+    stamp = file_stamp(PREDICTIVE_MODELS_FILE)
+    if stamp is None:
+        return None
+    days_ahead = forecast_horizon(request.args.get('days', 30, type=int))
+    return f'forecast-{stamp[0]:x}-{days_ahead}-{date.today().isoformat()}'
+
+@timed('save_data')
 def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    problem_store.write(DATA_FILE, lambda: run_blocking(_write_json, DATA_FILE, data), data)
+
+@timed('save_data')
+def save_problem(problem=None, delete=None):
+    """Save one added or changed problem (or delete one by id) without rebuilding the others as dicts"""
+    problem_store.commit(DATA_FILE, lambda payload: run_blocking(_write_bytes, DATA_FILE, payload),
+                         serialization.dumps, upsert=problem, delete=delete)
+
+# Daily trend metrics; seeded from creation dates the first time it is used
+metrics_log = MetricsLog(METRICS_DB)
+if metrics_log.is_empty():
+    metrics_log.backfill(predictive_models.prepare_time_series_data(problem_summaries()))
+
+def _indexed_problem(problem_id):
+    record = problem_store.get(problem_id)
+    return record.to_dict() if record else None
+
+# Full-text index, kept in step with every write below
+search_index = SearchIndex(fetch=_indexed_problem)
+
+def _on_store_reload():
+    """Catch the metrics log and search index up with a data file changed outside the app"""
+    # After the writer holding the lock has logged and indexed its own change
+    with data_lock:
+        store = problem_records()
+        # Edits made while the app was down, or by another process, become one correcting row
+        metrics_log.reconcile(store_totals(store))
+        records = {record.id: record for record in store}
+        search_index.sync({problem_id: record.revision() for problem_id, record in records.items()},
+                          lambda problem_id: records[problem_id].to_dict())
+
+problem_store.on_reload(_on_store_reload)
+_on_store_reload()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/problems', methods=['GET'])
+@conditional_read(lambda: problem_records().etag(), cache_control='private, no-cache')
 def get_problems():
     data = load_data()
     return jsonify(data)
 
 @app.route('/api/problems', methods=['POST'])
 def create_problem():
-    data = load_data()
     problem_data = request.json
+    if not isinstance(problem_data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     
     # Validate required fields
     required_fields = ['title', 'description']
     for field in required_fields:
-        if field not in problem_data:
+        if problem_data.get(field) is None:
             return jsonify({'error': f'Missing required field: {field}'}), 400
+    shape_error = problem_shape_error(problem_data)
+    if shape_error:
+        return jsonify({'error': shape_error}), 400
     
     # Create problem with unique ID
     problem = {
@@ -64,47 +181,154 @@ def create_problem():
         'impacts': problem_data.get('impacts', []),
         'feedback_loops': problem_data.get('feedback_loops', []),
         'remediations': problem_data.get('remediations', []),
+        'version': 1,
         'created_at': datetime.now().isoformat(),
         'updated_at': datetime.now().isoformat()
     }
+    with_derived(problem)
     
-    data['problems'].append(problem)
-    save_data(data)
+    with data_lock:
+        problem_records()  # picks up external edits before writing the file
+        save_problem(problem)
+        metrics_log.record_change(None, problem)
+        search_index.add(problem)
     return jsonify(problem), 201
 
 @app.route('/api/problems/<problem_id>', methods=['GET'])
+@conditional_read(_problem_etag, cache_control='private, no-cache')
 def get_problem(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     return jsonify(problem)
 
 @app.route('/api/problems/<problem_id>', methods=['PUT'])
 def update_problem(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
-    if not problem:
-        return jsonify({'error': 'Problem not found'}), 404
+    """Replace a problem's fields; server-managed fields in the body are ignored
     
+    With ``base_version`` in the body the update is refused with 409 when
+    the stored problem has moved on, so it cannot overwrite a merged patch.
+    """
     problem_data = request.json
-    problem.update(problem_data)
-    problem['updated_at'] = datetime.now().isoformat()
+    if not isinstance(problem_data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    base_version = problem_data.get('base_version')
+    changes = {k: v for k, v in problem_data.items() if k not in PROTECTED_FIELDS and k != 'base_version'}
+    shape_error = problem_shape_error(changes)
+    if shape_error:
+        return jsonify({'error': shape_error}), 400
     
-    save_data(data)
+    with data_lock:
+        problem = find_problem(problem_id)
+        if not problem:
+            return jsonify({'error': 'Problem not found'}), 404
+        
+        version = problem.get('version', 1)
+        if base_version is not None and base_version != version:
+            return jsonify({'error': 'Update conflicts with newer changes', 'version': version}), 409
+        
+        previous = dict(problem)
+        problem.update(changes)
+        problem['version'] = version + 1
+        problem['updated_at'] = datetime.now().isoformat()
+        with_derived(problem)
+        
+        save_problem(problem)
+        metrics_log.record_change(previous, problem)
+        search_index.add(problem)
     return jsonify(problem)
 
+@app.route('/api/problems/<problem_id>', methods=['PATCH'])
+def patch_problem(problem_id):
+    """Apply an RFC 6902 JSON Patch (or array-element shorthand) to a problem
+    
+    The body is either a list of operations or ``{"patch": [...],
+    "base_version": n}``. When ``base_version`` is behind the stored version
+    the patch is still merged as long as every operation is position
+    independent (appends, guards, object members); otherwise 409 is
+    returned so the client can rebase. Other collaborators receive the
+    operations as a ``problem_patched`` delta.
+    """
+    body = request.json
+    patch, base_version = body, None
+    if isinstance(body, dict):
+        patch, base_version = body.get('patch'), body.get('base_version')
+    
+    try:
+        operations = normalize_patch(patch)
+        for path in touched_paths(operations):
+            tokens = parse_pointer(path)
+            if not tokens or tokens[0] in PROTECTED_FIELDS:
+                return jsonify({'error': f'Path is not patchable: {path}'}), 400
+    except JsonPatchError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with data_lock:
+        # Only this problem is built as a dict; the rest of the store is untouched
+        problem = find_problem(problem_id)
+        if problem is None:
+            return jsonify({'error': 'Problem not found'}), 404
+        
+        version = problem.get('version', 1)
+        if base_version is not None and base_version != version and \
+           not all(is_position_independent(op) for op in operations):
+            return jsonify({'error': 'Patch conflicts with newer changes', 'version': version}), 409
+        
+        try:
+            patched = apply_patch(problem, operations)
+        except JsonPatchConflict as e:
+            return jsonify({'error': str(e), 'version': version}), 409
+        except JsonPatchError as e:
+            return jsonify({'error': str(e)}), 400
+        shape_error = problem_shape_error(patched)
+        if shape_error:
+            return jsonify({'error': shape_error}), 400
+        
+        patched['version'] = version + 1
+        patched['updated_at'] = datetime.now().isoformat()
+        with_derived(patched)
+        save_problem(patched)
+        metrics_log.record_change(problem, patched)
+        search_index.add(patched)
+    
+    # Send only the delta to everyone except the sender
+    delta = {
+        'problem_id': problem_id,
+        'base_version': version,
+        'version': patched['version'],
+        'updated_at': patched['updated_at'],
+        'patch': operations
+    }
+    socketio.emit('problem_patched', delta, skip_sid=request.headers.get('X-Socket-Id'))
+    
+    return jsonify({'id': problem_id, 'version': patched['version'], 'updated_at': patched['updated_at']})
+
 @app.route('/api/problems/<problem_id>', methods=['DELETE'])
 def delete_problem(problem_id):
-    data = load_data()
-    data['problems'] = [p for p in data['problems'] if p['id'] != problem_id]
-    save_data(data)
+    with data_lock:
+        problem = find_problem(problem_id)
+        if problem is not None:
+            save_problem(delete=problem_id)
+            metrics_log.record_change(problem, None)
+            search_index.remove(problem_id)
+            diagram_layout.forget(problem_id)
     return jsonify({'message': 'Problem deleted successfully'})
 
+@app.route('/api/search', methods=['GET'])
+def search_problems():
+    query = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    
+    if not query.strip():
+        return jsonify({'error': 'Missing query parameter: q'}), 400
+    
+    problem_records()  # picks up external edits to the data file before searching
+    return jsonify(search_index.search(query, page, per_page))
+
 @app.route('/api/export/<problem_id>', methods=['GET'])
 def export_problem(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
@@ -112,16 +336,25 @@ def export_problem(problem_id):
 
 @app.route('/api/import', methods=['POST'])
 def import_problem():
-    data = load_data()
     problem_data = request.json
+    if not isinstance(problem_data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    shape_error = problem_shape_error(problem_data)
+    if shape_error:
+        return jsonify({'error': shape_error}), 400
     
     # Generate new ID to avoid conflicts
     problem_data['id'] = str(uuid.uuid4())
+    problem_data['version'] = 1
     problem_data['created_at'] = datetime.now().isoformat()
     problem_data['updated_at'] = datetime.now().isoformat()
+    with_derived(problem_data)
     
-    data['problems'].append(problem_data)
-    save_data(data)
+    with data_lock:
+        problem_records()  # picks up external edits before writing the file
+        save_problem(problem_data)
+        metrics_log.record_change(None, problem_data)
+        search_index.add(problem_data)
     
     # Emit real-time update
     socketio.emit('problem_added', problem_data)
@@ -130,70 +363,69 @@ def import_problem():
 
 # ML Analytics Endpoints
 @app.route('/api/ml/train-patterns', methods=['POST'])
+@admission.admit('training')
 def train_pattern_models():
-    data = load_data()
-    problems = data.get('problems', [])
+    problems = problem_summaries()
     
-    result = ml_models.train_pattern_classifier(problems)
+    result = compute.call('ml', 'train_pattern_classifier', problems, persist=True)
     
     if result.get('model_trained'):
-        ml_models.save_models()
         socketio.emit('models_updated', {'type': 'pattern_classifier', 'status': 'trained'})
     
     return jsonify(result)
 
 @app.route('/api/ml/predict-archetype/<problem_id>', methods=['POST'])
+@admission.admit('model')
 def predict_archetype(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
-    result = ml_models.predict_system_archetype(problem)
+    result = compute.call('ml', 'predict_system_archetype', problem)
     return jsonify(result)
 
 @app.route('/api/ml/detect-anomalies', methods=['POST'])
+@admission.admit('analytics')
 def detect_anomalies():
-    data = load_data()
-    problems = data.get('problems', [])
+    problems = problem_summaries()
     
-    result = ml_models.detect_anomalies(problems)
+    result = compute.call('ml', 'detect_anomalies', problems)
     return jsonify(result)
 
 @app.route('/api/ml/cluster-problems', methods=['POST'])
+@admission.admit('analytics')
 def cluster_problems():
-    data = load_data()
-    problems = data.get('problems', [])
+    problems = problem_summaries()
     
-    result = ml_models.cluster_similar_problems(problems)
+    result = compute.call('ml', 'cluster_similar_problems', problems)
     return jsonify(result)
 
 @app.route('/api/ml/suggest-loops/<problem_id>', methods=['POST'])
+@admission.admit('model')
 def suggest_feedback_loops(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
-    result = ml_models.suggest_feedback_loops(problem)
+    result = compute.call('ml', 'suggest_feedback_loops', problem)
     return jsonify(result)
 
 # Predictive Analytics Endpoints
 @app.route('/api/predictive/train-models', methods=['POST'])
+@admission.admit('training')
 def train_predictive_models():
-    data = load_data()
-    problems = data.get('problems', [])
+    problems = problem_summaries()
     
-    # Train time series models
-    ts_result = predictive_models.train_time_series_models(problems)
+    # Train time series models from the pre-aggregated daily metrics
+    ts_result = compute.call('predictive', 'train_time_series_models',
+                             series=metrics_log.daily_series(), persist=True)
     
     # Train impact predictor
-    impact_result = predictive_models.train_impact_predictor(problems)
+    impact_result = compute.call('predictive', 'train_impact_predictor', problems, persist=True)
     
     if ts_result.get('models_trained') or impact_result.get('model_trained'):
-        predictive_models.save_models()
         socketio.emit('models_updated', {'type': 'predictive_models', 'status': 'trained'})
     
     return jsonify({
@@ -201,65 +433,162 @@ def train_predictive_models():
         'impact_predictor': impact_result
     })
 
+# Batch Compute Endpoints
+@app.route('/api/batch/train', methods=['POST'])
+@admission.admit('training')
+def batch_train_models():
+    """Retrain the classifier, impact predictor and trend models from sharded featurization"""
+    options = request.get_json(silent=True)
+    if not isinstance(options, dict):
+        options = {}
+    shard_size = batch_compute.parse_shard_size(options.get('shard_size', batch_compute.DEFAULT_SHARD_SIZE))
+    if shard_size is None:
+        return jsonify({'error': 'shard_size must be a positive integer'}), 400
+    problems = problem_summaries()
+    
+    try:
+        result = compute.call('batch', 'train', problems, series=metrics_log.daily_series(),
+                              shard_size=shard_size, persist=True)
+    except batch_compute.ShardTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    
+    if any(r.get('model_trained') or r.get('models_trained')
+           for r in (result['pattern_classifier'], result['impact_predictor'], result['time_series'])):
+        socketio.emit('models_updated', {'type': 'batch', 'status': 'trained'})
+    
+    return jsonify(result)
+
+@app.route('/api/batch/score', methods=['POST'])
+@admission.admit('analytics')
+def batch_score_problems():
+    """Score every problem with the saved models and store the results on the problems"""
+    options = request.get_json(silent=True)
+    if not isinstance(options, dict):
+        options = {}
+    shard_size = batch_compute.parse_shard_size(options.get('shard_size', batch_compute.DEFAULT_SHARD_SIZE))
+    if shard_size is None:
+        return jsonify({'error': 'shard_size must be a positive integer'}), 400
+    try:
+        scores = compute.call('batch', 'score', problem_summaries(), shard_size)
+    except batch_compute.ShardTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    
+    # Write back under the lock; problems deleted meanwhile are skipped
+    updated = 0
+    with data_lock:
+        data = load_data()
+        for problem in data['problems']:
+            score = scores.get(problem['id'])
+            if score:
+                problem['batch_scores'] = score
+                problem['version'] = problem.get('version', 1) + 1
+                updated += 1
+        if updated:
+            save_data(data)
+    
+    if updated:
+        socketio.emit('batch_scored', {'scored': updated})
+    
+    return jsonify({'scored': updated, 'total': len(data['problems'])})
+
 @app.route('/api/predictive/forecast', methods=['GET'])
+@conditional_read(_forecast_etag, cache_control='private, max-age=300',
+                  cacheable=lambda response: 'error' not in (response.get_json(silent=True) or {}))
+@admission.admit('model')
 def forecast_trends():
-    days_ahead = request.args.get('days', 30, type=int)
-    result = predictive_models.forecast_trends(days_ahead)
+    days_ahead = forecast_horizon(request.args.get('days', 30, type=int))
+    result = compute.call('predictive', 'forecast_trends', days_ahead)
     return jsonify(result)
 
 @app.route('/api/predictive/predict-impacts/<problem_id>', methods=['POST'])
+@admission.admit('model')
 def predict_impacts(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
-    result = predictive_models.predict_impacts(problem)
+    result = compute.call('predictive', 'predict_impacts', problem)
     return jsonify(result)
 
 @app.route('/api/predictive/simulate/<problem_id>', methods=['POST'])
+@admission.admit('model')
 def simulate_loop_dynamics(problem_id):
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = find_problem(problem_id)
     
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
     time_steps = request.json.get('time_steps', 50) if request.json else 50
-    result = predictive_models.simulate_loop_dynamics(problem, time_steps)
+    result = compute.call('predictive', 'simulate_loop_dynamics', problem, time_steps)
+    return jsonify(result)
+
+# Graph Analytics Endpoints
+@app.route('/api/analytics/graph/<problem_id>', methods=['GET'])
+@admission.admit('model')
+def analyze_problem_graph(problem_id):
+    problem = find_problem(problem_id)
+    
+    if not problem:
+        return jsonify({'error': 'Problem not found'}), 404
+    
+    top_k = request.args.get('top', 10, type=int)
+    result = compute.call('graph', 'analyze', problem, top_k)
     return jsonify(result)
 
+@app.route('/api/problems/<problem_id>/layout', methods=['GET'])
+@admission.admit('model')
+def get_problem_layout(problem_id):
+    problem = find_problem(problem_id)
+    
+    if not problem:
+        return jsonify({'error': 'Problem not found'}), 404
+    
+    # Cached per version; an edited problem is relaid out from its previous positions
+    layout = diagram_layout.cached(problem)
+    if layout is None:
+        computed = compute.call('layout', 'compute', problem, diagram_layout.previous(problem_id))
+        layout = diagram_layout.store(problem, computed)
+    return jsonify(layout)
+
 # WebSocket Events
 @socketio.on('connect')
 def handle_connect():
+    instrumentation.SOCKET_EVENTS.inc(direction='in', event='connect')
+    instrumentation.SOCKET_CLIENTS.inc()
     emit('connected', {'message': 'Connected to Causal Loop Analytics'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    instrumentation.SOCKET_EVENTS.inc(direction='in', event='disconnect')
+    instrumentation.SOCKET_CLIENTS.dec()
 
 @socketio.on('request_real_time_analysis')
 def handle_real_time_analysis(data):
     """Handle real-time analysis requests"""
+    instrumentation.SOCKET_EVENTS.inc(direction='in', event='request_real_time_analysis')
     problem_id = data.get('problem_id')
     
     if problem_id:
-        # Start background analysis
-        thread = threading.Thread(target=background_analysis, args=(problem_id,))
-        thread.daemon = True
-        thread.start()
+        # Start background analysis (a thread or a green thread, per serving mode)
+        socketio.start_background_task(background_analysis, problem_id)
 
 def background_analysis(problem_id):
     """Background task for real-time analysis"""
-    data = load_data()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    instrumentation.BACKGROUND_TASKS.inc(task='real_time_analysis')
+    try:
+        _run_background_analysis(problem_id)
+    finally:
+        instrumentation.BACKGROUND_TASKS.dec(task='real_time_analysis')
+
+def _run_background_analysis(problem_id):
+    problem = find_problem(problem_id)
     
     if problem:
         # Perform various analyses
         try:
             # Pattern prediction
-            archetype_result = ml_models.predict_system_archetype(problem)
+            archetype_result = compute.call('ml', 'predict_system_archetype', problem)
             socketio.emit('analysis_update', {
                 'problem_id': problem_id,
                 'type': 'archetype_prediction',
@@ -267,7 +596,7 @@ def background_analysis(problem_id):
             })
             
             # Loop suggestions
-            loop_suggestions = ml_models.suggest_feedback_loops(problem)
+            loop_suggestions = compute.call('ml', 'suggest_feedback_loops', problem)
             socketio.emit('analysis_update', {
                 'problem_id': problem_id,
                 'type': 'loop_suggestions',
@@ -275,7 +604,7 @@ def background_analysis(problem_id):
             })
             
             # Impact prediction
-            impact_prediction = predictive_models.predict_impacts(problem)
+            impact_prediction = compute.call('predictive', 'predict_impacts', problem)
             socketio.emit('analysis_update', {
                 'problem_id': problem_id,
                 'type': 'impact_prediction',
@@ -283,14 +612,15 @@ def background_analysis(problem_id):
             })
             
             # Simulation
-            simulation_result = predictive_models.simulate_loop_dynamics(problem)
+            simulation_result = compute.call('predictive', 'simulate_loop_dynamics', problem)
             socketio.emit('analysis_update', {
                 'problem_id': problem_id,
                 'type': 'simulation',
                 'data': simulation_result
             })
-            
+        
         except Exception as e:
+            instrumentation.BACKGROUND_ERRORS.inc(task='real_time_analysis')
             socketio.emit('analysis_error', {
                 'problem_id': problem_id,
                 'error': str(e)
@@ -300,29 +630,42 @@ def broadcast_system_updates():
     """Broadcast periodic system updates"""
     while True:
         try:
-            # Get current statistics
-            data = load_data()
-            problems = data.get('problems', [])
-            
+            # Get current statistics from the stored derived blocks
+            records = problem_records()
+            totals = dict(zip(DERIVED_COLUMNS, records.derived_matrix().sum(axis=0)))
             stats = {
-                'total_problems': len(problems),
-                'total_causes': sum(len(p.get('causes', [])) for p in problems),
-                'total_impacts': sum(len(p.get('impacts', [])) for p in problems),
-                'total_loops': sum(len(p.get('feedback_loops', [])) for p in problems),
+                'total_problems': len(records),
+                'total_causes': int(totals['counts.causes']),
+                'total_impacts': int(totals['counts.impacts']),
+                'total_loops': int(totals['counts.feedback_loops']),
                 'timestamp': datetime.now().isoformat()
             }
             
             socketio.emit('system_stats', stats)
-            
+        
         except Exception as e:
-            print(f"Error broadcasting updates: {e}")
+            instrumentation.BACKGROUND_ERRORS.inc(task='broadcast_system_updates')
+            app.logger.warning(f"Error broadcasting updates: {e}")
         
-        time.sleep(30)  # Update every 30 seconds
+        socketio.sleep(30)  # Update every 30 seconds
+
+@app.cli.command('backfill-derived')
+@click.option('--force', is_flag=True, help='Recompute blocks that are already current')
+def backfill_derived_command(force):
+    """Compute the derived-metrics block for every stored problem"""
+    with data_lock:
+        data = load_data()
+        updated = backfill_derived(data['problems'], force=force)
+        # The stored record changed, so cached copies (ETags) must too
+        for problem in updated:
+            problem['version'] = problem.get('version', 1) + 1
+        if updated:
+            save_data(data)
+    click.echo(f"Updated derived metrics for {len(updated)} of {len(data['problems'])} problems")
 
 # Start background broadcasting
-broadcast_thread = threading.Thread(target=broadcast_system_updates)
-broadcast_thread.daemon = True
-broadcast_thread.start()
+broadcast_thread = socketio.start_background_task(broadcast_system_updates)
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    # The reloader and debugger only suit the threaded development server
+    socketio.run(app, debug=ASYNC_MODE == 'threading', host='0.0.0.0', port=5000)
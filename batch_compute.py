@@ -0,0 +1,214 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from celery import Celery, group
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+from ml_models import CausalLoopMLModels
+from predictive_models import PredictiveAnalytics, TREND_METRICS, impact_features
+from derived_metrics import derived_metrics
+
+# Problems per featurization or scoring task, and the largest a request may ask for
+DEFAULT_SHARD_SIZE = 5000
+MAX_SHARD_SIZE = 100000
+
+# Without a broker URL the tasks run in-process on Celery's in-memory
+# transport, which is what single-node installs use. Point
+# CELERY_BROKER_URL at Redis or RabbitMQ and start workers with
+# ``celery -A batch_compute worker`` to spread shards over nodes; the
+# workers need the same working directory (model files) as the app.
+BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+
+# Results must travel back through something every node shares: the broker
+# itself unless configured otherwise (RabbitMQ replies over rpc://)
+if BROKER_URL == 'memory://':
+    DEFAULT_RESULT_BACKEND = 'cache+memory://'
+elif BROKER_URL.startswith(('amqp', 'pyamqp')):
+    DEFAULT_RESULT_BACKEND = 'rpc://'
+else:
+    DEFAULT_RESULT_BACKEND = BROKER_URL
+
+# Seconds to wait for every shard of one batch before giving up
+SHARD_TIMEOUT = float(os.environ.get('CELERY_SHARD_TIMEOUT', 600))
+
+celery_app = Celery(
+    'causal_batch',
+    broker=BROKER_URL,
+    backend=os.environ.get('CELERY_RESULT_BACKEND', DEFAULT_RESULT_BACKEND)
+)
+celery_app.conf.update(
+    task_serializer='json',
+    result_serializer='json',
+    accept_content=['json'],
+    task_always_eager=os.environ.get('CELERY_TASK_ALWAYS_EAGER', '1' if BROKER_URL == 'memory://' else '0') == '1',
+    task_eager_propagates=True
+)
+
+# Models cached per worker process, reloaded when the files on disk change
+_worker_models: Dict[str, Any] = {'stamp': None, 'ml': None, 'predictive': None}
+
+
+class ShardTimeout(Exception):
+    """The shards of a batch did not all finish within SHARD_TIMEOUT"""
+
+
+def _model_stamp() -> tuple:
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None
+                 for path in ('ml_models.joblib', 'predictive_models.joblib'))
+
+
+def _load_models():
+    stamp = _model_stamp()
+    if _worker_models['stamp'] != stamp:
+        ml = CausalLoopMLModels()
+        ml.load_models()
+        predictive = PredictiveAnalytics()
+        predictive.load_models()
+        _worker_models.update(stamp=stamp, ml=ml, predictive=predictive)
+    return _worker_models['ml'], _worker_models['predictive']
+
+
+def parse_shard_size(value: Any) -> Optional[int]:
+    """Shard size from a request body, clamped to MAX_SHARD_SIZE; None unless a positive integer"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        return None
+    return min(value, MAX_SHARD_SIZE)
+
+
+def shard(problems: List[Dict], shard_size: int = DEFAULT_SHARD_SIZE) -> List[List[Dict]]:
+    shard_size = max(1, shard_size)
+    return [problems[i:i + shard_size] for i in range(0, len(problems), shard_size)]
+
+
+@celery_app.task(name='batch_compute.featurize_shard')
+def featurize_shard(problems: List[Dict], with_series: bool = False) -> Dict[str, Any]:
+    """Extract classifier and impact-predictor training data for one shard"""
+    ml = CausalLoopMLModels()
+    result = {
+        'pattern_features': ml.extract_features(problems).tolist(),
+        'archetype_labels': ml.archetype_labels(problems),
+        'impact_features': [impact_features(problem) for problem in problems],
+        'impact_targets': [derived_metrics(problem)['counts']['impacts'] for problem in problems]
+    }
+    if with_series:
+        # Daily sums are additive, so shards' partial series merge by day
+        series = PredictiveAnalytics().prepare_time_series_data(problems)
+        result['series'] = {
+            'day': np.datetime_as_string(series['day']).tolist(),
+            **{name: series[name].tolist() for name in ('problem_count',) + TREND_METRICS}
+        }
+    return result
+
+
+@celery_app.task(name='batch_compute.score_shard')
+def score_shard(problems: List[Dict]) -> List[Dict[str, Any]]:
+    """Archetype and impact-count predictions for one shard with the saved models"""
+    ml, predictive = _load_models()
+    archetypes = ml.predict_system_archetypes(problems)
+    impact_counts = predictive.predict_impact_counts(problems)
+    
+    scores = []
+    for i, problem in enumerate(problems):
+        score = {'id': problem.get('id')}
+        if archetypes:
+            score['archetype'] = archetypes[i]['predicted_archetype']
+            score['archetype_confidence'] = archetypes[i]['confidence']
+        if impact_counts:
+            score['predicted_impact_count'] = impact_counts[i]
+        scores.append(score)
+    return scores
+
+
+def _run_shards(signatures) -> List[Any]:
+    """Fan the shard tasks out and gather their results in order"""
+    result = group(signatures).apply_async()
+    try:
+        return result.get(timeout=SHARD_TIMEOUT, disable_sync_subtasks=False)
+    except CeleryTimeoutError:
+        result.revoke()
+        raise ShardTimeout(f'Batch shards did not finish within {SHARD_TIMEOUT:g}s') from None
+
+
+def _merge_series(partials: List[Dict[str, List]]) -> Dict[str, np.ndarray]:
+    columns = ('problem_count',) + TREND_METRICS
+    days = np.concatenate([np.array(p['day'], dtype='datetime64[D]') for p in partials])
+    unique_days, bucket = np.unique(days, return_inverse=True)
+    series = {'day': unique_days}
+    for name in columns:
+        values = np.concatenate([np.asarray(p[name], dtype=float) for p in partials])
+        series[name] = np.bincount(bucket, weights=values, minlength=len(unique_days))
+    return series
+
+
+def train_models(problems: List[Dict], ml: CausalLoopMLModels, predictive: PredictiveAnalytics,
+                 series: Optional[Dict[str, np.ndarray]] = None,
+                 shard_size: int = DEFAULT_SHARD_SIZE) -> Dict[str, Any]:
+    """Featurize shards in parallel, then fit each model once on the merged data
+    
+    ``series`` is the pre-aggregated daily series for the trend models;
+    when omitted the shards also build partial daily series from creation
+    dates. Trained models are saved so scoring workers pick them up.
+    """
+    shards = shard(problems, shard_size)
+    partials = _run_shards(featurize_shard.s(part, series is None) for part in shards) if shards else []
+    
+    if partials:
+        pattern_X = np.vstack([np.asarray(p['pattern_features'], dtype=float) for p in partials])
+        impact_X = np.vstack([np.asarray(p['impact_features'], dtype=float) for p in partials])
+    else:
+        pattern_X = impact_X = np.empty((0, 0))
+    labels = [label for p in partials for label in p['archetype_labels']]
+    impact_y = np.array([target for p in partials for target in p['impact_targets']])
+    if series is None:
+        series = _merge_series([p['series'] for p in partials]) if partials else \
+            predictive.prepare_time_series_data([])
+    
+    result = {
+        'shards': len(shards),
+        'pattern_classifier': ml.fit_pattern_classifier(pattern_X, labels),
+        'impact_predictor': predictive.fit_impact_predictor(impact_X, impact_y),
+        'time_series': predictive.train_time_series_models(series=series)
+    }
+    if result['pattern_classifier'].get('model_trained'):
+        ml.save_models()
+    if result['impact_predictor'].get('model_trained') or result['time_series'].get('models_trained'):
+        predictive.save_models()
+    return result
+
+
+class BatchJobs:
+    """Compute-pool target running :func:`train_models` and :func:`score_problems`"""
+    
+    def __init__(self, ml: CausalLoopMLModels, predictive: PredictiveAnalytics):
+        self.ml = ml
+        self.predictive = predictive
+    
+    def train(self, problems: List[Dict], series: Optional[Dict[str, np.ndarray]] = None,
+              shard_size: int = DEFAULT_SHARD_SIZE) -> Dict[str, Any]:
+        return train_models(problems, self.ml, self.predictive, series=series, shard_size=shard_size)
+    
+    def score(self, problems: List[Dict], shard_size: int = DEFAULT_SHARD_SIZE) -> Dict[str, Dict[str, Any]]:
+        return score_problems(problems, shard_size)
+    
+    def save_models(self):
+        """Nothing left to do: train_models saved whichever models it fitted"""
+    
+    def load_models(self):
+        self.ml.load_models()
+        self.predictive.load_models()
+
+
+def score_problems(problems: List[Dict], shard_size: int = DEFAULT_SHARD_SIZE) -> Dict[str, Dict[str, Any]]:
+    """Batch archetype and impact scores keyed by problem id"""
+    shards = shard(problems, shard_size)
+    results = _run_shards(score_shard.s(part) for part in shards) if shards else []
+    scored_at = datetime.now().isoformat()
+    scores = {}
+    for shard_scores in results:
+        for score in shard_scores:
+            problem_id = score.pop('id')
+            if score:
+                scores[problem_id] = dict(score, scored_at=scored_at)
+    return scores
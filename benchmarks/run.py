@@ -0,0 +1,276 @@
+"""Benchmark the API, ML and simulation hot paths against synthetic stores
+
+Usage (from the repository root):
+
+    python -m benchmarks.run                       # default sizes, compare to baseline
+    python -m benchmarks.run --sizes 10,1000,100000 --repeat 5
+    python -m benchmarks.run --update-baseline     # record the current numbers
+
+Results are written as JSON. Timings are seconds (lower is better) except
+``*_per_sec`` throughput figures; payload sizes are bytes. A run fails
+(exit code 1) when any median timing is slower than the baseline by more
+than the tolerance; timings under the noise floor in both runs are not
+compared, and throughput figures follow the timing they derive from.
+Timings are only compared when the baseline was recorded with the same
+Python minor version, measured package versions, machine architecture and
+run settings; otherwise the run exits with code 2 (see
+``--ignore-environment``). The committed baseline is recorded against
+requirements.txt.
+"""
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.synthetic import generate_problems
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# Model training is too slow to repeat at every size; larger stores are sampled
+TRAINING_SAMPLE = 20000
+
+# Packages whose versions move the measured numbers
+MEASURED_PACKAGES = ('numpy', 'scipy', 'scikit-learn', 'flask', 'orjson')
+
+# Environment fields that must match the baseline's for timings to be comparable;
+# 'platform' (OS and kernel string) is recorded for reference only
+COMPARABLE_FIELDS = ('python', 'machine', 'packages', 'repeat', 'shape')
+
+# Medians this short (seconds) swing by more than the tolerance from scheduling noise alone
+NOISE_FLOOR = 0.005
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {'median': statistics.median(samples), 'min': min(samples)}
+
+
+def _package_versions() -> Dict[str, str]:
+    versions = {}
+    for name in MEASURED_PACKAGES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _import_app(workdir: str):
+    """Import the Flask app with its data files redirected into ``workdir``"""
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+
+def bench_api(app_module, problems: List[Dict], repeat: int) -> Dict[str, Any]:
+    """CRUD latency and payload sizes through the Flask test client"""
+    with open(app_module.DATA_FILE, 'w') as f:
+        json.dump({'problems': problems}, f)
+    
+    client = app_module.app.test_client()
+    problem_id = problems[len(problems) // 2]['id']
+    new_problem = dict(problems[0], title='Benchmark problem')
+    results = {}
+    
+    results['list'] = _time(lambda: client.get('/api/problems'), repeat)
+    results['get'] = _time(lambda: client.get(f'/api/problems/{problem_id}'), repeat)
+    
+    created = []
+    results['create'] = _time(lambda: created.append(client.post('/api/problems', json=new_problem).get_json()['id']),
+                              repeat)
+    results['update'] = _time(lambda: client.put(f'/api/problems/{problem_id}', json={'title': 'Updated'}), repeat)
+    results['delete'] = _time(lambda: client.delete(f'/api/problems/{created.pop()}'), repeat)
+    
+    results['payload_bytes'] = {
+        'list': len(client.get('/api/problems').data),
+        'get': len(client.get(f'/api/problems/{problem_id}').data),
+        'simulate': len(client.post(f'/api/predictive/simulate/{problem_id}', json={'time_steps': 200}).data)
+    }
+    return results
+
+
+def bench_ml(problems: List[Dict], repeat: int) -> Dict[str, Any]:
+    """Feature extraction, training and prediction of both model families"""
+    from ml_models import CausalLoopMLModels
+    from predictive_models import PredictiveAnalytics
+    
+    training_set = problems[:TRAINING_SAMPLE]
+    ml = CausalLoopMLModels()
+    predictive = PredictiveAnalytics()
+    results = {'training_sample': len(training_set)}
+    
+    results['extract_features'] = _time(lambda: ml.extract_features(problems), repeat)
+    results['prepare_time_series'] = _time(lambda: predictive.prepare_time_series_data(problems), repeat)
+    
+    if len(training_set) >= 10:
+        results['train_pattern_classifier'] = _time(lambda: ml.train_pattern_classifier(training_set), 1)
+        results['predict_archetype'] = _time(lambda: ml.predict_system_archetype(problems[0]), repeat)
+        results['train_impact_predictor'] = _time(lambda: predictive.train_impact_predictor(training_set), 1)
+        results['predict_impacts'] = _time(lambda: predictive.predict_impacts(problems[0]), repeat)
+        results['train_time_series'] = _time(lambda: predictive.train_time_series_models(training_set), 1)
+        
+        def cold_forecast():
+            # Forecasts are cached per horizon and day; measure the computation
+            predictive._forecast_cache.clear()
+            return predictive.forecast_trends(30)
+        results['forecast_30d'] = _time(cold_forecast, repeat)
+        results['detect_anomalies'] = _time(lambda: ml.detect_anomalies(training_set), 1)
+        results['cluster_problems'] = _time(lambda: ml.cluster_similar_problems(training_set), 1)
+    
+    results['suggest_loops'] = _time(lambda: ml.suggest_feedback_loops(problems[0]), repeat)
+    return results
+
+
+def bench_simulation(problems: List[Dict], repeat: int, time_steps: int = 1000) -> Dict[str, Any]:
+    """Simulation throughput on the problem with the most feedback loops"""
+    from predictive_models import PredictiveAnalytics
+    
+    predictive = PredictiveAnalytics()
+    problem = max(problems, key=lambda p: len(p.get('feedback_loops', [])))
+    if not problem.get('feedback_loops'):
+        return {}
+    
+    timing = _time(lambda: predictive.simulate_loop_dynamics(problem, time_steps), repeat)
+    return {
+        'loops': len(problem['feedback_loops']),
+        'time_steps': time_steps,
+        'simulate': timing,
+        'steps_per_sec': time_steps / timing['median'] if timing['median'] else float('inf')
+    }
+
+
+def run(sizes: List[int], repeat: int, shape: Dict[str, Any]) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='causal-bench-')
+    app_module = _import_app(workdir)
+    
+    report = {
+        'environment': {
+            'python': '.'.join(platform.python_version_tuple()[:2]),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'packages': _package_versions(),
+            'repeat': repeat,
+            'shape': shape
+        },
+        'results': {}
+    }
+    for size in sizes:
+        problems = generate_problems(size, **shape)
+        report['results'][str(size)] = {
+            'api': bench_api(app_module, problems, repeat),
+            'ml': bench_ml(problems, repeat),
+            'simulation': bench_simulation(problems, repeat)
+        }
+        print(f"benchmarked {size} problems", file=sys.stderr)
+    return report
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + '.'))
+        elif isinstance(value, (int, float)):
+            flat[path] = float(value)
+    return flat
+
+
+def environment_mismatches(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Environment fields that differ between two reports"""
+    # Round-trip through JSON so tuples compare equal to the lists a saved report holds
+    now = json.loads(json.dumps(current.get('environment', {})))
+    before = baseline.get('environment', {})
+    return [name for name in COMPARABLE_FIELDS if now.get(name) != before.get(name)]
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            noise_floor: float = NOISE_FLOOR) -> List[Dict[str, Any]]:
+    """Median timings that grew by more than ``tolerance`` (a fraction), ignoring those under ``noise_floor``"""
+    now = _flatten(current['results'])
+    before = _flatten(baseline.get('results', {}))
+    regressions = []
+    for key, old in before.items():
+        if key not in now or old <= 0 or not key.endswith('.median'):
+            continue
+        new = now[key]
+        if max(old, new) < noise_floor:
+            continue
+        change = new / old - 1
+        if change > tolerance:
+            regressions.append({'metric': key, 'baseline': old, 'current': new, 'change': change})
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help='comma-separated store sizes, up to 100000')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions per timing')
+    parser.add_argument('--causes', default='1,8', help='min,max causes per problem')
+    parser.add_argument('--impacts', default='1,8', help='min,max impacts per problem')
+    parser.add_argument('--loops', default='0,4', help='min,max feedback loops per problem')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown as a fraction')
+    parser.add_argument('--noise-floor', type=float, default=NOISE_FLOOR,
+                        help='seconds; medians under this in both runs are not compared')
+    parser.add_argument('--update-baseline', action='store_true', help='overwrite the baseline with this run')
+    parser.add_argument('--ignore-environment', action='store_true',
+                        help='compare even when the baseline was recorded in a different environment')
+    args = parser.parse_args(argv)
+    
+    def pair(value):
+        low, high = (int(v) for v in value.split(','))
+        return (low, high)
+    
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    shape = {'causes': pair(args.causes), 'impacts': pair(args.impacts), 'loops': pair(args.loops)}
+    report = run([int(s) for s in args.sizes.split(',')], args.repeat, shape)
+    
+    regressions, mismatches = [], []
+    if os.path.exists(baseline_path) and not args.update_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        mismatches = environment_mismatches(report, baseline)
+        if not mismatches or args.ignore_environment:
+            regressions = compare(report, baseline, args.tolerance, args.noise_floor)
+    report['environment_mismatches'] = mismatches
+    report['regressions'] = regressions
+    
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if mismatches:
+        print(f"Baseline environment differs ({', '.join(mismatches)}); "
+              + ("comparing anyway" if args.ignore_environment else
+                 "not comparing. Record a new baseline with --update-baseline or pass --ignore-environment"),
+              file=sys.stderr)
+        if not args.ignore_environment:
+            return 2
+    for regression in regressions:
+        print(f"REGRESSION {regression['metric']}: {regression['baseline']:.6g} -> "
+              f"{regression['current']:.6g} ({regression['change']:+.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
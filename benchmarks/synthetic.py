@@ -0,0 +1,68 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from derived_metrics import with_derived
+from keyword_matcher import ARCHETYPE_KEYWORDS, IMPACT_TYPE_KEYWORDS, POLARITY_KEYWORDS
+
+CAUSE_TYPES = ['primary', 'secondary', 'latent']
+IMPACT_TYPES = list(IMPACT_TYPE_KEYWORDS)
+LOOP_TYPES = ['reinforcing', 'balancing']
+REMEDIATION_TYPES = ['short_term', 'long_term', 'preventive']
+
+_SUBJECTS = ['demand', 'capacity', 'backlog', 'staff', 'budget', 'quality', 'latency', 'errors',
+             'morale', 'revenue', 'churn', 'workload', 'inventory', 'price', 'trust', 'load']
+
+
+def _phrase(rng: random.Random, vocabulary: Dict[str, List[str]]) -> str:
+    label = rng.choice(list(vocabulary))
+    return f"{rng.choice(vocabulary[label]).replace('_', ' ')} {rng.choice(_SUBJECTS)}"
+
+
+def generate_problem(rng: random.Random, causes: Tuple[int, int] = (1, 8), impacts: Tuple[int, int] = (1, 8),
+                     loops: Tuple[int, int] = (0, 4), now: datetime = None) -> Dict:
+    """Build one problem shaped like the ones the API stores, derived block included"""
+    now = now or datetime.now()
+    created = now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+    
+    cause_list = [{'description': f"{_phrase(rng, POLARITY_KEYWORDS)} {i}", 'type': rng.choice(CAUSE_TYPES)}
+                  for i in range(rng.randint(*causes))]
+    impact_list = [{'description': f"{_phrase(rng, POLARITY_KEYWORDS)} {i}", 'type': rng.choice(IMPACT_TYPES)}
+                   for i in range(rng.randint(*impacts))]
+    
+    names = [c['description'] for c in cause_list] + [i['description'] for i in impact_list]
+    loop_list = []
+    for i in range(rng.randint(*loops)):
+        chain = rng.sample(names, min(len(names), rng.randint(2, 4)))
+        loop_list.append({
+            'description': f"Loop {i}",
+            'type': rng.choice(LOOP_TYPES),
+            'relationships': chain + chain[:1]
+        })
+    
+    return with_derived({
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'title': f"{_phrase(rng, ARCHETYPE_KEYWORDS)} problem",
+        'description': ' '.join(_phrase(rng, vocabulary)
+                                for vocabulary in (ARCHETYPE_KEYWORDS, IMPACT_TYPE_KEYWORDS, ARCHETYPE_KEYWORDS)),
+        'causes': cause_list,
+        'impacts': impact_list,
+        'feedback_loops': loop_list,
+        'remediations': [{'description': f"Remediation {i}", 'type': rng.choice(REMEDIATION_TYPES)}
+                         for i in range(rng.randint(0, 3))],
+        'version': 1,
+        'created_at': created.isoformat(),
+        'updated_at': created.isoformat()
+    })
+
+
+def generate_problems(count: int, seed: int = 42, **shape) -> List[Dict]:
+    """Deterministic synthetic store of ``count`` problems
+    
+    ``shape`` accepts the ``causes``, ``impacts`` and ``loops`` (min, max)
+    ranges of ``generate_problem``.
+    """
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1)
+    return [generate_problem(rng, now=now, **shape) for _ in range(count)]
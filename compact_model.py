@@ -0,0 +1,398 @@
+import hashlib
+import os
+import sys
+import threading
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from derived_metrics import CAUSE_TYPES, DERIVED_SCHEMA, IMPACT_TYPES, LOOP_TYPES, compute_derived
+
+# Marks a field that was absent from the source dict, so round trips are lossless
+_MISSING = object()
+
+# Flat column order of a packed derived block
+COUNT_FIELDS = ('causes', 'impacts', 'feedback_loops', 'remediations')
+DERIVED_COLUMNS = (
+    tuple(f'counts.{name}' for name in COUNT_FIELDS)
+    + tuple(f'cause_types.{name}' for name in CAUSE_TYPES)
+    + tuple(f'impact_types.{name}' for name in IMPACT_TYPES)
+    + tuple(f'loop_polarity.{name}' for name in LOOP_TYPES)
+    + ('complexity_score',)
+)
+
+
+class Codebook:
+    """Two-way mapping between type values and small integer codes
+    
+    Code 0 means the item had no ``type`` key. Known types are registered
+    up front so their codes are stable; anything else is added on first use.
+    """
+    
+    def __init__(self, known: Tuple[str, ...] = ()):
+        self._values: List[Any] = [_MISSING]
+        self._codes: Dict[Any, int] = {}
+        for value in known:
+            self.code(value)
+    
+    def code(self, value: Any) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(sys.intern(value) if isinstance(value, str) else value)
+        return code
+    
+    def value(self, code: int) -> Any:
+        return self._values[code]
+
+
+CAUSE_CODES = Codebook(CAUSE_TYPES)
+IMPACT_CODES = Codebook(IMPACT_TYPES)
+LOOP_CODES = Codebook(LOOP_TYPES)
+REMEDIATION_CODES = Codebook(('short_term', 'long_term', 'preventive'))
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _hashable(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+class ItemTable:
+    """Columnar storage for a list of ``{"description", "type", ...}`` items"""
+    
+    __slots__ = ('codebook', 'descriptions', 'types', 'extras')
+    
+    def __init__(self, codebook: Codebook):
+        self.codebook = codebook
+        self.descriptions: List[Any] = []
+        self.types = array('I')
+        # Per-row dict of any other keys (remediation targets, loop relationships, ...);
+        # None when no row has any
+        self.extras: Optional[List[Optional[Dict[str, Any]]]] = None
+    
+    @classmethod
+    def from_dicts(cls, items: List[Dict[str, Any]], codebook: Codebook) -> 'ItemTable':
+        table = cls(codebook)
+        for item in items:
+            table.append(item)
+        return table
+    
+    def append(self, item: Dict[str, Any]):
+        extra = {k: v for k, v in item.items() if k not in ('description', 'type')}
+        kind = item.get('type', _MISSING)
+        if kind is not _MISSING and not _hashable(kind):
+            extra['type'] = kind
+            kind = _MISSING
+        if 'relationships' in extra and isinstance(extra['relationships'], list):
+            # Loop chains repeat cause and impact names; share one string object each
+            extra['relationships'] = tuple(_intern(step) for step in extra['relationships'])
+        
+        self.descriptions.append(item.get('description', _MISSING))
+        self.types.append(0 if kind is _MISSING else self.codebook.code(kind))
+        if extra and self.extras is None:
+            self.extras = [None] * (len(self.descriptions) - 1)
+        if self.extras is not None:
+            self.extras.append(extra or None)
+    
+    def __len__(self) -> int:
+        return len(self.descriptions)
+    
+    def type_of(self, row: int) -> Any:
+        return self.codebook.value(self.types[row])
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        items = []
+        for row, description in enumerate(self.descriptions):
+            item = {}
+            if description is not _MISSING:
+                item['description'] = description
+            if self.types[row]:
+                item['type'] = self.codebook.value(self.types[row])
+            extra = self.extras[row] if self.extras is not None else None
+            if extra:
+                for key, value in extra.items():
+                    item[key] = list(value) if key == 'relationships' and isinstance(value, tuple) else value
+            items.append(item)
+        return items
+
+
+def pack_derived(derived: Dict[str, Any]) -> array:
+    values = array('d')
+    for column in DERIVED_COLUMNS:
+        group, _, name = column.partition('.')
+        values.append(derived[group][name] if name else derived[group])
+    return values
+
+
+def unpack_derived(values: array) -> Dict[str, Any]:
+    derived: Dict[str, Any] = {'schema': DERIVED_SCHEMA}
+    for column, value in zip(DERIVED_COLUMNS, values):
+        group, _, name = column.partition('.')
+        if name:
+            derived.setdefault(group, {})[name] = int(value)
+        else:
+            derived[group] = value
+    return derived
+
+
+class ProblemRecord:
+    """Compact in-memory form of one stored problem; dicts only at the JSON boundary"""
+    
+    __slots__ = ('id', 'title', 'description', 'causes', 'impacts', 'feedback_loops', 'remediations',
+                 'version', 'created_at', 'updated_at', 'derived', 'extra', 'encoded')
+    
+    def __init__(self, id: Any, title: Any, description: Any, causes: Optional[ItemTable],
+                 impacts: Optional[ItemTable], feedback_loops: Optional[ItemTable],
+                 remediations: Optional[ItemTable], version: Any, created_at: Any, updated_at: Any,
+                 derived: Optional[array], extra: Optional[Dict[str, Any]]):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.causes = causes
+        self.impacts = impacts
+        self.feedback_loops = feedback_loops
+        self.remediations = remediations
+        self.version = version
+        self.created_at = created_at
+        self.updated_at = updated_at
+        # Current-schema derived block as a flat float array (see DERIVED_COLUMNS)
+        self.derived = derived
+        # Any other top-level keys, e.g. batch_scores or an outdated derived block
+        self.extra = extra
+        # The problem as JSON, kept once serialized so unchanged problems are not re-encoded on save
+        self.encoded: Optional[bytes] = None
+    
+    COLLECTIONS = (('causes', CAUSE_CODES), ('impacts', IMPACT_CODES),
+                   ('feedback_loops', LOOP_CODES), ('remediations', REMEDIATION_CODES))
+    SCALARS = ('id', 'title', 'description', 'version', 'created_at', 'updated_at')
+    
+    @classmethod
+    def from_dict(cls, problem: Dict[str, Any]) -> 'ProblemRecord':
+        values = {name: problem.get(name, _MISSING) for name in cls.SCALARS}
+        extra = {k: v for k, v in problem.items()
+                 if k not in cls.SCALARS and k not in dict(cls.COLLECTIONS) and k != 'derived'}
+        
+        for name, codebook in cls.COLLECTIONS:
+            items = problem.get(name, _MISSING)
+            if isinstance(items, list) and all(isinstance(item, dict) for item in items):
+                values[name] = ItemTable.from_dicts(items, codebook)
+            else:
+                values[name] = None
+                if items is not _MISSING:
+                    extra[name] = items
+        
+        derived = problem.get('derived')
+        values['derived'] = None
+        if isinstance(derived, dict) and derived.get('schema') == DERIVED_SCHEMA:
+            try:
+                values['derived'] = pack_derived(derived)
+            except (KeyError, TypeError):
+                extra['derived'] = derived
+        elif derived is not None:
+            extra['derived'] = derived
+        
+        return cls(extra=extra or None, **values)
+    
+    def revision(self) -> Tuple[Any, Any]:
+        """(version, updated_at) as ``search_index.revision`` reads them from the dict"""
+        return (None if self.version is _MISSING else self.version,
+                None if self.updated_at is _MISSING else self.updated_at)
+    
+    def encode(self, dumps: Callable[[Any], bytes]) -> bytes:
+        """The problem as JSON, encoded on first use and kept"""
+        if self.encoded is None:
+            self.encoded = dumps(self.to_dict())
+        return self.encoded
+    
+    def etag(self, dumps: Callable[[Any], bytes]) -> str:
+        """Strong validator for this problem: its version plus a digest of its content
+        
+        The digest covers edits made to the data file outside the app,
+        which leave the version as it was.
+        """
+        version = 1 if self.version is _MISSING else self.version
+        return f'{self.id}-v{version}-{hashlib.blake2b(self.encode(dumps), digest_size=8).hexdigest()}'
+    
+    def to_dict(self) -> Dict[str, Any]:
+        problem = {}
+        for name in ('id', 'title', 'description'):
+            value = getattr(self, name)
+            if value is not _MISSING:
+                problem[name] = value
+        for name, _ in self.COLLECTIONS:
+            table = getattr(self, name)
+            if table is not None:
+                problem[name] = table.to_dicts()
+        for name in ('version', 'created_at', 'updated_at'):
+            value = getattr(self, name)
+            if value is not _MISSING:
+                problem[name] = value
+        if self.derived is not None:
+            problem['derived'] = unpack_derived(self.derived)
+        if self.extra:
+            problem.update(self.extra)
+        return problem
+    
+    def summary(self) -> Dict[str, Any]:
+        """Scalars and the derived block: what the store-wide models read, without the item lists"""
+        problem = {name: getattr(self, name) for name in self.SCALARS if getattr(self, name) is not _MISSING}
+        problem['derived'] = unpack_derived(self.derived) if self.derived is not None \
+            else compute_derived(self.to_dict())
+        return problem
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ProblemStore:
+    """The whole problem store held as compact records
+    
+    ``sync`` re-reads the data file only when its mtime or size changed
+    (another process wrote it); ``write`` saves the file and refreshes the
+    records from the dicts just saved, so the file is parsed once per
+    external change instead of once per request. Callbacks registered with
+    ``on_reload`` run after ``sync`` picked up such a change.
+    
+    ``commit`` saves a change to one problem without building dicts for
+    the others: the file is joined from each record's encoded JSON, which
+    is computed once per record and kept (roughly the file size in memory).
+    """
+    
+    def __init__(self):
+        # Records and the id -> position index, published together as one
+        # tuple so a reader never pairs one version's index with another's list
+        self._snapshot: Tuple[List[ProblemRecord], Dict[Any, int]] = ([], {})
+        self._meta: Dict[str, Any] = {}
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        # Held across a file write and the matching replace, so sync never
+        # mistakes this process's own write for an external one
+        self._file_lock = threading.RLock()
+        self._reload_callbacks: List[Callable[[], None]] = []
+    
+    def on_reload(self, callback: Callable[[], None]):
+        self._reload_callbacks.append(callback)
+    
+    def sync(self, path: str, read: Callable[[], Dict[str, Any]]) -> 'ProblemStore':
+        with self._file_lock:
+            stamp = file_stamp(path)
+            reloaded = stamp != self._stamp
+            if stamp is None:
+                self.replace({"problems": []}, None)
+            elif reloaded:
+                self.replace(read(), stamp)
+        if reloaded:
+            for callback in self._reload_callbacks:
+                callback()
+        return self
+    
+    def write(self, path: str, write: Callable[[], Any], data: Dict[str, Any]):
+        """Run ``write`` (which saves ``data`` to ``path``) and refresh the records from ``data``"""
+        with self._file_lock:
+            write()
+            self.replace(data, file_stamp(path), reuse=True)
+    
+    def commit(self, path: str, write: Callable[[bytes], Any], dumps: Callable[[Any], bytes],
+               upsert: Optional[Dict[str, Any]] = None, delete: Any = None):
+        """Save the store with ``upsert`` added or replaced (by id), or with the problem ``delete`` removed
+        
+        ``write`` saves the encoded file to ``path``; ``dumps`` encodes one
+        problem or the top-level metadata.
+        """
+        with self._file_lock:
+            with self._lock:
+                records, index = self._snapshot
+                meta = dict(self._meta)
+            records = list(records)
+            if upsert is not None:
+                record = ProblemRecord.from_dict(upsert)
+                record.encoded = dumps(upsert)
+                i = index.get(record.id)
+                if i is None:
+                    records.append(record)
+                else:
+                    records[i] = record
+            elif delete in index:
+                del records[index[delete]]
+            
+            write(self._encode(records, meta, dumps))
+            self._publish(records, meta, file_stamp(path))
+    
+    @staticmethod
+    def _encode(records: List[ProblemRecord], meta: Dict[str, Any], dumps: Callable[[Any], bytes]) -> bytes:
+        encoded = [record.encode(dumps) for record in records]
+        tail = dumps(meta)[1:-1] if meta else b''
+        return b''.join((b'{"problems":[', b','.join(encoded), b']',
+                         b',' + tail if tail else b'', b'}'))
+    
+    def _publish(self, records: List[ProblemRecord], meta: Dict[str, Any], stamp: Optional[Tuple[int, int]]):
+        with self._lock:
+            self._snapshot = (records, {record.id: i for i, record in enumerate(records)})
+            self._meta = meta
+            self._stamp = stamp
+    
+    def replace(self, data: Dict[str, Any], stamp: Optional[Tuple[int, int]] = None, reuse: bool = False):
+        """Rebuild the records from dicts
+        
+        With ``reuse`` a problem whose id, version and updated_at match a
+        held record keeps that record instead of being converted again;
+        every in-process writer bumps the version, so only edited problems
+        pay for conversion.
+        """
+        held = {}
+        if reuse:
+            with self._lock:
+                held = {(r.id, r.version, r.updated_at): r for r in self._snapshot[0]}
+        records = [
+            held.get((problem.get('id'), problem.get('version', _MISSING), problem.get('updated_at', _MISSING)))
+            or ProblemRecord.from_dict(problem)
+            for problem in data.get('problems', [])
+        ]
+        self._publish(records, {k: v for k, v in data.items() if k != 'problems'}, stamp)
+    
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+    
+    def __iter__(self) -> Iterator[ProblemRecord]:
+        return iter(self._snapshot[0])
+    
+    def etag(self) -> str:
+        """Strong validator for the whole store, derived from the data file's mtime and size"""
+        with self._lock:
+            stamp = self._stamp
+        return f'store-{stamp[0]:x}-{stamp[1]:x}' if stamp else 'store-empty'
+    
+    def get(self, problem_id: Any) -> Optional[ProblemRecord]:
+        records, index = self._snapshot
+        i = index.get(problem_id)
+        return records[i] if i is not None else None
+    
+    def to_data(self) -> Dict[str, Any]:
+        """Fresh dicts for the JSON boundary and read-modify-write callers"""
+        with self._lock:
+            records, meta = self._snapshot[0], dict(self._meta)
+        return dict(meta, problems=[record.to_dict() for record in records])
+    
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Every problem as ``ProblemRecord.summary``, for the store-wide models"""
+        return [record.summary() for record in self._snapshot[0]]
+    
+    def derived_matrix(self) -> np.ndarray:
+        """Derived blocks of every problem as an (n, len(DERIVED_COLUMNS)) matrix"""
+        records = self._snapshot[0]
+        matrix = np.empty((len(records), len(DERIVED_COLUMNS)))
+        for i, record in enumerate(records):
+            if record.derived is not None:
+                matrix[i] = record.derived
+            else:
+                matrix[i] = pack_derived(compute_derived(record.to_dict()))
+        return matrix
@@ -0,0 +1,343 @@
+"""Serving-mode selection and offloading of blocking work
+
+``ASYNC_MODE`` picks the Socket.IO/WSGI concurrency model: ``threading``
+(the default development server), ``eventlet`` or ``gevent``. In the two
+cooperative modes thousands of idle websocket connections cost a green
+thread each, so nothing may block the event loop:
+
+* file I/O goes through :func:`run_blocking`, which hands it to a native
+  thread (eventlet's ``tpool`` or gevent's hub threadpool);
+* CPU-bound model, graph and simulation calls go through
+  :class:`ComputePool`, a process pool whose workers keep their own copies
+  of the models and reload them from disk whenever training changed them.
+
+``COMPUTE_WORKERS`` sets the pool size (default: one per CPU in the
+cooperative modes, 0 in threading mode). 0 runs every call inline on the
+caller's model instances, which is how the app behaved before. The
+workers are forked by :func:`monkey_patch`, before the standard library
+is patched, so they never inherit a patched interpreter or event hub.
+The parent talks to each one over a socket pair that it only wraps after
+patching, so waiting for a result is an ordinary cooperative socket read
+rather than a thread blocked inside the event loop.
+
+``python compute_pool.py`` is a smoke test: it patches, starts the pool
+and runs concurrent calls in the workers.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import socket
+import struct
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE not in ASYNC_MODES:
+    raise ValueError(f"ASYNC_MODE must be one of {', '.join(ASYNC_MODES)}, got {ASYNC_MODE!r}")
+
+
+def worker_count() -> int:
+    """Pool size from ``COMPUTE_WORKERS``, defaulting by serving mode"""
+    default = 0 if ASYNC_MODE == 'threading' else (os.cpu_count() or 1)
+    return max(0, int(os.environ.get('COMPUTE_WORKERS', default)))
+
+
+# Workers forked before monkey-patching, adopted by the first ComputePool of the same size
+_prestarted: Dict[str, List['_Worker']] = {'workers': []}
+
+def monkey_patch():
+    """Patch the standard library for the selected mode; call before any other import
+    
+    In the cooperative modes the compute workers are forked first, while
+    threads, locks and sockets are still the native ones.
+    """
+    if ASYNC_MODE != 'threading' and not _prestarted['workers']:
+        _prestarted['workers'] = [_Worker() for _ in range(worker_count())]
+    if ASYNC_MODE == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif ASYNC_MODE == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call without stalling the event loop of a cooperative mode"""
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    if ASYNC_MODE == 'gevent':
+        from gevent import get_hub
+        return get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
+
+
+# Per-worker model instances, reloaded when the parent's generation moves on
+_worker_state: Dict[str, Any] = {'generation': None, 'targets': {}}
+
+
+def _worker_targets(generation: int) -> Dict[str, Any]:
+    if _worker_state['generation'] != generation:
+        from ml_models import CausalLoopMLModels
+        from predictive_models import PredictiveAnalytics
+        from graph_analytics import GraphAnalytics
+        from layout import DiagramLayout
+        from batch_compute import BatchJobs
+        
+        ml = CausalLoopMLModels()
+        ml.load_models()
+        predictive = PredictiveAnalytics()
+        predictive.load_models()
+        _worker_state['targets'] = {'ml': ml, 'predictive': predictive, 'graph': GraphAnalytics(),
+                                    'layout': DiagramLayout(), 'batch': BatchJobs(ml, predictive)}
+        _worker_state['generation'] = generation
+    return _worker_state['targets']
+
+
+def _invoke(generation: int, family: str, method: str, args: tuple, kwargs: dict, persist: bool) -> Any:
+    """Worker entry point: run one model call and save the models if it trained them"""
+    target = _worker_targets(generation)[family]
+    result = getattr(target, method)(*args, **kwargs)
+    if persist and isinstance(result, dict) and 'error' not in result:
+        target.save_models()
+    return result
+
+
+def _send(conn: socket.socket, message: Any):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    conn.sendall(struct.pack('!Q', len(payload)) + payload)
+
+
+def _recv(conn: socket.socket) -> Any:
+    size, = struct.unpack('!Q', _recv_exact(conn, 8))
+    return pickle.loads(_recv_exact(conn, size))
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = conn.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise EOFError('compute worker connection closed')
+        buffer += chunk
+    return bytes(buffer)
+
+
+# Parent ends of the workers' sockets; each new worker closes its inherited copies
+_parent_fds: List[int] = []
+
+
+def _serve(conn: socket.socket, inherited: List[int]):
+    """Worker main loop: answer requests until the parent closes its end"""
+    # Ctrl-C reaches the whole process group; shutting down is the parent's call
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for fd in inherited:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    
+    while True:
+        try:
+            request = _recv(conn)
+        except EOFError:
+            return
+        if request is None:
+            reply = (True, os.getpid())
+        else:
+            try:
+                reply = (True, _invoke(*request))
+            except Exception as exc:
+                reply = (False, exc)
+        try:
+            _send(conn, reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as exc:
+            _send(conn, (False, RuntimeError(f'Unpicklable compute result: {exc}')))
+
+
+class _Worker:
+    """One forked worker process and the parent's end of its socket pair
+    
+    The parent's socket object is built from the descriptor on first use,
+    i.e. after monkey-patching, so in the cooperative modes a call waits
+    on the event loop instead of blocking it.
+    """
+    
+    def __init__(self):
+        parent_end, child_end = socket.socketpair()
+        # Fork keeps workers from re-running app.py's module-level setup
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.process = context.Process(target=_serve, args=(child_end, list(_parent_fds) + [parent_end.fileno()]),
+                                       daemon=True)
+        self.process.start()
+        child_end.close()
+        self._fd = parent_end.detach()
+        _parent_fds.append(self._fd)
+        self._conn: Optional[socket.socket] = None
+    
+    def call(self, request: Optional[tuple]) -> Tuple[bool, Any]:
+        """Send one request and wait for ``(ok, result or exception)``; None asks for the worker's pid"""
+        if self._conn is None:
+            self._conn = socket.socket(fileno=self._fd)
+        _send(self._conn, request)
+        return _recv(self._conn)
+    
+    def close(self):
+        if self._fd in _parent_fds:
+            _parent_fds.remove(self._fd)
+        if self._conn is not None:
+            self._conn.close()
+        else:
+            os.close(self._fd)
+        self.process.join(timeout=1)
+
+
+class ComputePool:
+    """Run model, graph and simulation calls in worker processes
+    
+    ``targets`` maps a family name (``ml``, ``predictive``, ``graph``, ``layout``, ``batch``) to
+    the parent's instance, used directly when the pool has no workers.
+    Calls made with ``persist=True`` train a model: they are serialized,
+    the trained models are saved by whichever process ran them, and the
+    parent and the other workers reload them before their next call.
+    """
+    
+    def __init__(self, targets: Dict[str, Any], workers: Optional[int] = None):
+        if workers is None:
+            workers = worker_count()
+        self.targets = targets
+        self.workers = max(0, workers)
+        self.generation = 0
+        # Callers blocked until a worker is idle, exported as a queue-depth gauge
+        self.waiting = 0
+        self._live: List[_Worker] = []
+        # Idle workers; created on first use so that its locks are the patched ones
+        self._idle: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self._train_lock = threading.Lock()
+    
+    def _idle_workers(self) -> queue.Queue:
+        with self._lock:
+            if self._idle is None:
+                workers = _prestarted['workers']
+                if len(workers) == self.workers:
+                    _prestarted['workers'] = []
+                else:
+                    workers = [_Worker() for _ in range(self.workers)]
+                self._live = list(workers)
+                self._idle = queue.Queue()
+                for worker in workers:
+                    self._idle.put(worker)
+            return self._idle
+    
+    def _next_worker(self) -> Optional[_Worker]:
+        idle = self._idle_workers()
+        with self._lock:
+            self.waiting += 1
+        try:
+            return idle.get()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+    
+    def _lost(self, worker: _Worker):
+        """Replace a worker that died; in the cooperative modes forking now would copy the event hub"""
+        worker.close()
+        with self._lock:
+            self._live.remove(worker)
+            if ASYNC_MODE == 'threading':
+                replacement = _Worker()
+                self._live.append(replacement)
+                self._idle.put(replacement)
+            elif not self._live:
+                # Wakes every waiting caller, which then runs inline
+                self._idle.put(None)
+    
+    def call(self, family: str, method: str, *args, persist: bool = False, **kwargs) -> Any:
+        """Call ``targets[family].method(*args, **kwargs)``, off the event loop"""
+        if not persist:
+            return self._call(family, method, args, kwargs, persist)
+        with self._train_lock:
+            result = self._call(family, method, args, kwargs, persist)
+            if isinstance(result, dict) and 'error' not in result:
+                self.generation += 1
+            return result
+    
+    @staticmethod
+    def _timer(family: str, method: str):
+        # Observed in the parent: a worker's own fit/predict timings stay in its process.
+        # Imported here because this module is loaded before monkey-patching
+        from instrumentation import timed
+        return timed('compute', family=family, method=method)
+    
+    def _call(self, family: str, method: str, args: tuple, kwargs: dict, persist: bool) -> Any:
+        with self._timer(family, method):
+            return self._dispatch(family, method, args, kwargs, persist)
+    
+    def _dispatch(self, family: str, method: str, args: tuple, kwargs: dict, persist: bool) -> Any:
+        target = self.targets[family]
+        worker = self._next_worker() if self.workers else None
+        if worker is None:
+            if self.workers:
+                self._idle.put(None)
+            result = getattr(target, method)(*args, **kwargs)
+            if persist and isinstance(result, dict) and 'error' not in result:
+                target.save_models()
+            return result
+        
+        try:
+            ok, result = worker.call((self.generation, family, method, args, kwargs, persist))
+        except (OSError, EOFError) as exc:
+            self._lost(worker)
+            raise RuntimeError(f'Compute worker for {family}.{method} exited') from exc
+        self._idle.put(worker)
+        if not ok:
+            raise result
+        if persist and isinstance(result, dict) and 'error' not in result:
+            target.load_models()
+        return result
+    
+    def worker_pids(self) -> List[int]:
+        """Ask every idle worker for its pid (a round trip through each one)"""
+        idle = self._idle_workers()
+        workers = [idle.get() for _ in range(len(self._live))]
+        try:
+            return [worker.call(None)[1] for worker in workers if worker is not None]
+        finally:
+            for worker in workers:
+                idle.put(worker)
+    
+    def shutdown(self):
+        with self._lock:
+            workers, self._live, self._idle = self._live, [], None
+        for worker in workers:
+            worker.close()
+
+
+if __name__ == '__main__':
+    monkey_patch()
+    from graph_analytics import GraphAnalytics
+    
+    pool = ComputePool({'graph': GraphAnalytics()}, workers=max(1, worker_count()))
+    problem = {'id': 'smoke', 'title': 'Slow queries',
+               'causes': [{'description': 'missing index'}], 'impacts': [{'description': 'timeouts'}]}
+    results = []
+    # More callers than workers, so some wait for an idle worker (green threads once patched)
+    callers = [threading.Thread(target=lambda: results.append(pool.call('graph', 'analyze', problem)))
+               for _ in range(2 * pool.workers)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join(timeout=60)
+    pids = pool.worker_pids()
+    pool.shutdown()
+    ok = (len(results) == len(callers) and all(isinstance(r, dict) and 'error' not in r for r in results)
+          and len(pids) == pool.workers and os.getpid() not in pids)
+    print(f"{ASYNC_MODE}: {len(results)}/{len(callers)} calls over {pool.workers} workers {pids}, "
+          f"{'ok' if ok else 'FAILED'}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,110 @@
+from typing import Dict, List, Any, Optional
+
+# Bump when the block's layout or formulas change; older blocks are recomputed
+DERIVED_SCHEMA = 1
+
+CAUSE_TYPES = ('primary', 'secondary', 'latent')
+IMPACT_TYPES = ('technical', 'business', 'operational', 'environmental', 'health', 'educational')
+LOOP_TYPES = ('reinforcing', 'balancing')
+
+# Problem fields holding free text
+TEXT_FIELDS = ('title', 'description')
+
+# Problem fields holding lists of item objects
+COLLECTIONS = ('causes', 'impacts', 'feedback_loops', 'remediations')
+
+
+def collection_items(problem: Dict, name: str) -> List[Dict]:
+    """The item objects of one collection; a missing or malformed one counts as empty"""
+    items = problem.get(name)
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def problem_shape_error(problem: Dict) -> Optional[str]:
+    """Why the problem cannot be stored, or None: text fields must be strings, collections lists of objects"""
+    for name in TEXT_FIELDS:
+        if problem.get(name) is not None and not isinstance(problem[name], str):
+            return f'Field {name} must be a string'
+    for name in COLLECTIONS:
+        items = problem.get(name, [])
+        if not isinstance(items, list):
+            return f'Field {name} must be a list'
+        if not all(isinstance(item, dict) for item in items):
+            return f'Every entry of {name} must be an object'
+    return None
+
+
+def calculate_complexity_score(problem: Dict) -> float:
+    """Calculate complexity score for a problem"""
+    causes = collection_items(problem, 'causes')
+    impacts = collection_items(problem, 'impacts')
+    feedback_loops = collection_items(problem, 'feedback_loops')
+    
+    # Weight different factors
+    score = 0
+    score += len(causes) * 1.0
+    score += len(impacts) * 0.8
+    score += len(feedback_loops) * 1.5
+    
+    # Add complexity for different types
+    cause_types = set(c.get('type') for c in causes)
+    impact_types = set(i.get('type') for i in impacts)
+    score += len(cause_types) * 0.5
+    score += len(impact_types) * 0.3
+    
+    return score
+
+
+def _type_counts(items: List[Dict], known: tuple) -> Dict[str, int]:
+    counts = dict.fromkeys(known, 0)
+    for item in items:
+        kind = item.get('type')
+        if isinstance(kind, str) and kind in counts:
+            counts[kind] += 1
+    return counts
+
+
+def compute_derived(problem: Dict) -> Dict[str, Any]:
+    """Build the derived-metrics block for a problem from its raw lists"""
+    causes = collection_items(problem, 'causes')
+    impacts = collection_items(problem, 'impacts')
+    feedback_loops = collection_items(problem, 'feedback_loops')
+    return {
+        'schema': DERIVED_SCHEMA,
+        'counts': {
+            'causes': len(causes),
+            'impacts': len(impacts),
+            'feedback_loops': len(feedback_loops),
+            'remediations': len(collection_items(problem, 'remediations'))
+        },
+        'cause_types': _type_counts(causes, CAUSE_TYPES),
+        'impact_types': _type_counts(impacts, IMPACT_TYPES),
+        'loop_polarity': _type_counts(feedback_loops, LOOP_TYPES),
+        'complexity_score': calculate_complexity_score(problem)
+    }
+
+
+def with_derived(problem: Dict) -> Dict:
+    """Store a freshly computed derived block on the problem; call on every write"""
+    problem['derived'] = compute_derived(problem)
+    return problem
+
+
+def derived_metrics(problem: Dict) -> Dict[str, Any]:
+    """Return the stored derived block, computing it for records written before it existed"""
+    derived = problem.get('derived')
+    if isinstance(derived, dict) and derived.get('schema') == DERIVED_SCHEMA:
+        return derived
+    return compute_derived(problem)
+
+
+def backfill_derived(problems: List[Dict], force: bool = False) -> List[Dict]:
+    """Attach derived blocks to stored problems, returning the ones that were (re)computed"""
+    updated = []
+    for problem in problems:
+        derived = problem.get('derived')
+        if force or not isinstance(derived, dict) or derived.get('schema') != DERIVED_SCHEMA:
+            updated.append(with_derived(problem))
+    return updated
@@ -0,0 +1,260 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Any
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigs
+
+from loop_discovery import PROBLEM_NODE, SignedGraph, build_signed_graph, find_loops, loop_links
+from predictive_models import SIMULATION_DECAY_RATE, SIMULATION_GROWTH_RATE
+
+
+def _betweenness(adjacency: sparse.csr_matrix, max_sources: int = 256, batch_size: int = 64) -> np.ndarray:
+    """Brandes betweenness on an unweighted digraph, many BFS sources at a time
+    
+    Each batch runs one breadth-first search per source as sparse
+    matrix products over an (n x batch) frontier. Graphs with more than
+    ``max_sources`` nodes use an evenly spaced sample of sources and scale
+    the result, which keeps the cost bounded for large models.
+    """
+    n = adjacency.shape[0]
+    if n < 3:
+        return np.zeros(n)
+    
+    reverse = adjacency.T.tocsr()
+    sources = np.arange(n)
+    if n > max_sources:
+        sources = np.linspace(0, n - 1, max_sources).astype(int)
+    
+    scores = np.zeros(n)
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start + batch_size]
+        columns = np.arange(len(batch))
+        
+        # Forward pass: shortest-path counts (sigma) level by level
+        sigma = np.zeros((n, len(batch)))
+        sigma[batch, columns] = 1.0
+        seen = sigma > 0
+        frontier = sigma.copy()
+        levels = [seen.copy()]
+        while True:
+            reach = reverse @ frontier
+            new = (reach > 0) & ~seen
+            if not new.any():
+                break
+            seen |= new
+            frontier = np.where(new, reach, 0.0)
+            sigma += frontier
+            levels.append(new)
+        
+        # Backward pass: accumulate dependencies from the deepest level up
+        delta = np.zeros((n, len(batch)))
+        safe_sigma = np.where(sigma > 0, sigma, 1.0)
+        for depth in range(len(levels) - 1, 0, -1):
+            coefficient = np.where(levels[depth], (1.0 + delta) / safe_sigma, 0.0)
+            delta += np.where(levels[depth - 1], sigma * (adjacency @ coefficient), 0.0)
+        
+        delta[batch, columns] = 0.0
+        scores += delta.sum(axis=1)
+    
+    scores *= n / len(sources)
+    return scores / ((n - 1) * (n - 2))
+
+
+def _eigenvector_centrality(adjacency: sparse.csr_matrix, max_iter: int = 100, tol: float = 1e-6) -> np.ndarray:
+    """Power iteration on (A + I)^T, which converges on graphs with sources and sinks"""
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    
+    reverse = adjacency.T.tocsr()
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_next = reverse @ x + x
+        norm = np.linalg.norm(x_next)
+        if norm == 0:
+            return x_next
+        x_next /= norm
+        if np.abs(x_next - x).sum() < n * tol:
+            return x_next
+        x = x_next
+    return x
+
+
+def _dominant_eigenpair(matrix: sparse.csr_matrix) -> Tuple[complex, np.ndarray, np.ndarray]:
+    """Eigenvalue with the largest real part plus its right and left eigenvectors"""
+    n = matrix.shape[0]
+    if n <= 400:
+        dense = matrix.toarray()
+        values, right = np.linalg.eig(dense)
+        k = int(np.argmax(values.real))
+        left_values, left = np.linalg.eig(dense.T)
+        j = int(np.argmin(np.abs(left_values - values[k])))
+        return values[k], right[:, k], left[:, j]
+    
+    values, right = eigs(matrix, k=1, which='LR')
+    _, left = eigs(matrix.T.tocsr(), k=1, sigma=values[0])
+    return values[0], right[:, 0], left[:, 0]
+
+
+class GraphAnalytics:
+    """Centrality, component and loop-dominance analysis of a problem's causal graph"""
+    
+    def __init__(self, cache_size: int = 256):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def analyze(self, problem: Dict, top_k: int = 10) -> Dict[str, Any]:
+        """Analyze a problem, reusing the result until the problem changes"""
+        key = (problem.get('id'), problem.get('version', 1), top_k)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        
+        result = self._analyze(problem, top_k)
+        
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+    
+    def _analyze(self, problem: Dict, top_k: int) -> Dict[str, Any]:
+        graph = build_signed_graph(problem)
+        keys = list(graph.labels)
+        index = {key: i for i, key in enumerate(keys)}
+        n = len(keys)
+        
+        rows, cols, gains = [], [], []
+        for source, targets in graph.edges.items():
+            for target, (sign, weight, _) in targets.items():
+                rows.append(index[source])
+                cols.append(index[target])
+                gains.append(sign * weight)
+        adjacency = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+        
+        component_count, component_labels = connected_components(adjacency, directed=True, connection='strong')
+        component_sizes = np.bincount(component_labels, minlength=component_count)
+        cyclic = [c for c in np.argsort(-component_sizes) if component_sizes[c] > 1]
+        
+        betweenness = _betweenness(adjacency)
+        eigenvector = _eigenvector_centrality(adjacency)
+        
+        cycles, truncated = find_loops(graph)
+        participation = np.zeros(n)
+        for cycle in cycles:
+            participation[[index[node] for node in cycle]] += 1
+        if cycles:
+            participation /= len(cycles)
+        
+        # Leverage: on many shortest paths, near other influential variables, inside many loops
+        def scaled(values):
+            peak = values.max() if n else 0
+            return values / peak if peak > 0 else values
+        leverage = 0.4 * scaled(betweenness) + 0.3 * scaled(eigenvector) + 0.3 * scaled(participation)
+        
+        def node_entry(i, **extra):
+            return {"node": graph.labels[keys[i]], "kind": graph.kinds[keys[i]], **extra}
+        
+        order = [i for i in np.argsort(-leverage) if keys[i] != PROBLEM_NODE][:top_k]
+        dominance = self._loop_dominance(graph, keys, index, rows, cols, gains, cycles, top_k)
+        
+        return {
+            "problem_id": problem.get('id'),
+            "version": problem.get('version', 1),
+            "graph": {"nodes": n, "edges": len(rows)},
+            "components": {
+                "strongly_connected": int(component_count),
+                "cyclic": [
+                    [graph.labels[keys[i]] for i in np.flatnonzero(component_labels == c)]
+                    for c in cyclic[:top_k]
+                ],
+                "largest_cyclic_size": int(component_sizes[cyclic[0]]) if cyclic else 0
+            },
+            "leverage_points": [
+                node_entry(i, score=float(leverage[i]), betweenness=float(betweenness[i]),
+                           eigenvector=float(eigenvector[i]), loop_share=float(participation[i]))
+                for i in order
+            ],
+            "centrality": {
+                "betweenness": [node_entry(i, score=float(betweenness[i]))
+                                for i in np.argsort(-betweenness)[:top_k]],
+                "eigenvector": [node_entry(i, score=float(eigenvector[i]))
+                                for i in np.argsort(-eigenvector)[:top_k]]
+            },
+            "loop_dominance": dominance,
+            "system_metrics": self._system_metrics(dominance),
+            "loops_found": len(cycles),
+            "loops_truncated": truncated
+        }
+    
+    def _system_metrics(self, dominance: Dict[str, Any]) -> Dict[str, Any]:
+        """Stability, growth per simulation step and dominance from the dominant eigenvalue"""
+        eigenvalue = dominance['dominant_eigenvalue']
+        if eigenvalue['real'] > 0:
+            stability = "volatile"
+        elif dominance['behavior'] == "oscillating":
+            stability = "moderate"
+        else:
+            stability = "stable"
+        return {
+            "stability": stability,
+            "growth_rate": float(np.expm1(eigenvalue['real']) * 100),
+            "dominance": dominance['dominant_polarity'] if dominance['dominant_polarity'] != "none" else "balanced"
+        }
+    
+    def _loop_dominance(self, graph: SignedGraph, keys: List[str], index: Dict[str, int],
+                        rows: List[int], cols: List[int], gains: List[float],
+                        cycles: List[List[str]], top_k: int) -> Dict[str, Any]:
+        """Loop eigenvalue elasticities of the linearized simulation
+        
+        The Jacobian couples every variable to its causes with the signed link
+        confidence times the simulation growth rate and damps every variable
+        at the simulation decay rate. A loop's elasticity is the relative
+        change of the dominant eigenvalue per relative change in the gains of
+        its links; the loop with the largest one dominates behaviour.
+        """
+        n = len(keys)
+        if not cycles:
+            return {"dominant_polarity": "none", "behavior": "goal_seeking",
+                    "dominant_eigenvalue": {"real": -SIMULATION_DECAY_RATE, "imag": 0.0}, "loops": []}
+        
+        # d(x_target)/dt depends on x_source, so the Jacobian entry is [target, source]
+        coupling = sparse.csr_matrix((np.array(gains) * SIMULATION_GROWTH_RATE, (cols, rows)), shape=(n, n))
+        mu, right, left = _dominant_eigenpair(coupling)
+        eigenvalue = mu - SIMULATION_DECAY_RATE
+        
+        scale = mu * (left @ right)
+        loops = []
+        for cycle in cycles:
+            elasticity = 0.0
+            for source, target in zip(cycle, cycle[1:] + cycle[:1]):
+                s, t = index[source], index[target]
+                if abs(scale) > 1e-12:
+                    elasticity += (coupling[t, s] * left[t] * right[s] / scale).real
+            negative_links = sum(1 for sign, _, _ in loop_links(graph, cycle) if sign < 0)
+            labels = [graph.labels[node] for node in cycle]
+            loops.append({
+                "type": "balancing" if negative_links % 2 else "reinforcing",
+                "relationships": labels + labels[:1],
+                "elasticity": float(elasticity)
+            })
+        loops.sort(key=lambda loop: -abs(loop['elasticity']))
+        
+        if abs(eigenvalue.imag) > 1e-9:
+            behavior = "oscillating"
+        elif eigenvalue.real > 0:
+            behavior = "exponential_growth"
+        else:
+            behavior = "goal_seeking"
+        
+        return {
+            "dominant_polarity": loops[0]['type'] if abs(loops[0]['elasticity']) > 0 else "none",
+            "behavior": behavior,
+            "dominant_eigenvalue": {"real": float(eigenvalue.real), "imag": float(eigenvalue.imag)},
+            "loops": loops[:top_k]
+        }
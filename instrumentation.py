@@ -0,0 +1,379 @@
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Response, g, jsonify, request
+
+# Prometheus default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Lowest slow-request threshold the profiler accepts; below it nearly every request is dumped
+MIN_PROFILE_THRESHOLD_MS = 50
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (k + '="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    """Base for a named metric family with labelled series"""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+    
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+    
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(k)} {v}' for k, v in self._values.items()]
+
+
+class Gauge(Metric):
+    """Gauge set directly or read from a callback at scrape time"""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self.callback = callback
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+    
+    def value(self, **labels) -> float:
+        if self.callback is not None:
+            return float(self.callback())
+        return self._values.get(_label_key(labels), 0.0)
+    
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f'{self.name} {float(self.callback())}']
+        with self._lock:
+            return [f'{self.name}{_format_labels(k)} {v}' for k, v in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelKey, List[float]] = {}
+    
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+    
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return int(series[-2]) if series else 0
+    
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_format_labels(key, (("le", repr(bound)),))} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(key, (("le", "+Inf"),))} {series[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {series[-2]}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    """Process-wide collection of metrics rendered in Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+    
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+    
+    def gauge(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, callback)
+    
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets)
+    
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'causal_http_request_duration_seconds', 'HTTP request latency by route, method and status')
+OPERATION_LATENCY = registry.histogram(
+    'causal_operation_duration_seconds', 'Latency of storage, feature extraction, fit and predict operations')
+SOCKET_EVENTS = registry.counter(
+    'causal_socket_events_total', 'Socket.IO events by direction and event name')
+SOCKET_CLIENTS = registry.gauge(
+    'causal_socket_connected_clients', 'Currently connected Socket.IO clients')
+BACKGROUND_TASKS = registry.gauge(
+    'causal_background_tasks', 'Background analysis tasks currently running')
+BACKGROUND_ERRORS = registry.counter(
+    'causal_background_errors_total', 'Errors raised by background tasks by task name')
+registry.gauge('causal_python_threads', 'Live Python threads', callback=threading.active_count)
+
+
+class timed:
+    """Time a block or function into ``causal_operation_duration_seconds``
+    
+    Works as a context manager (``with timed('save_data'):``) and as a
+    decorator (``@timed('fit', model='pattern_classifier')``).
+    """
+    
+    def __init__(self, operation: str, **labels):
+        self.labels = dict(labels, operation=operation)
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        OPERATION_LATENCY.observe(time.perf_counter() - self._start, **self.labels)
+        return False
+    
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(**self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+class SamplingProfiler:
+    """Opt-in wall-clock sampler for slow requests
+    
+    While enabled, a single daemon thread samples the stacks of every
+    thread currently serving a request. When a request finishes slower
+    than the threshold its samples are written in collapsed-stack format
+    (``frame;frame;frame count``), ready for flamegraph.pl or speedscope.
+    At most ``max_files`` dumps are kept; the oldest are removed first.
+    
+    Requests are keyed by ``threading.get_ident()`` and looked up in
+    ``sys._current_frames()``, which is keyed by OS thread. Under eventlet
+    or gevent the ident is a green thread's, so nothing is sampled there;
+    profile with ``ASYNC_MODE=threading``.
+    """
+    
+    def __init__(self, interval: float = 0.005, threshold: float = 0.5, output_dir: str = 'profiles',
+                 max_files: int = 100):
+        self.interval = interval
+        self.threshold = threshold
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self.enabled = False
+        self._active: Dict[int, TallyCounter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+    
+    def enable(self, threshold: Optional[float] = None):
+        if threshold is not None:
+            self.threshold = threshold
+        self.enabled = True
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_forever, daemon=True)
+            self._thread.start()
+    
+    def disable(self):
+        self.enabled = False
+    
+    def begin(self):
+        if self.enabled:
+            with self._lock:
+                self._active[threading.get_ident()] = TallyCounter()
+    
+    def end(self, duration: float, name: str) -> Optional[str]:
+        """Stop sampling the current thread and dump its stacks if the request was slow"""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or duration < self.threshold:
+            return None
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() else '_' for c in name).strip('_') or 'request'
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(duration * 1000)}ms-{safe_name}.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        self._prune()
+        return path
+    
+    def _prune(self):
+        dumps = sorted((entry for entry in os.scandir(self.output_dir) if entry.name.endswith('.folded')),
+                       key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in dumps[:max(0, len(dumps) - self.max_files)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.enabled:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    samples[';'.join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def init_app(app, socketio=None):
+    """Install request timing, the /metrics endpoint and Socket.IO emit counting
+    
+    The profiler is switched on at startup with ``PROFILE_SLOW_REQUESTS_MS``.
+    Changing it over HTTP is only allowed when ``PROFILER_CONTROL=1``.
+    """
+    
+    profiler.max_files = int(os.environ.get('PROFILE_MAX_FILES', profiler.max_files))
+    threshold_ms = os.environ.get('PROFILE_SLOW_REQUESTS_MS')
+    if threshold_ms:
+        profiler.enable(max(float(threshold_ms), MIN_PROFILE_THRESHOLD_MS) / 1000.0)
+    remote_control = os.environ.get('PROFILER_CONTROL') == '1'
+    
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        profiler.begin()
+    
+    @app.after_request
+    def _record_request_latency(response):
+        started = g.get('request_started')
+        if started is not None:
+            duration = time.perf_counter() - started
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.observe(duration, route=route, method=request.method, status=response.status_code)
+        return response
+    
+    @app.teardown_request
+    def _finish_request_profile(exc):
+        # Runs even when the view raised, so the thread's samples are always released
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            profiler.end(time.perf_counter() - started, f'{request.method} {route}')
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
+    
+    @app.route('/metrics/profiler', methods=['GET', 'POST'])
+    def toggle_profiler():
+        if request.method == 'POST':
+            if not remote_control:
+                return jsonify({'error': 'Profiler control is disabled; set PROFILER_CONTROL=1 to allow it'}), 403
+            settings = request.get_json(silent=True)
+            if not isinstance(settings, dict):
+                return jsonify({'error': 'Expected a JSON object'}), 400
+            if settings.get('enabled', True):
+                threshold = settings.get('threshold_ms')
+                if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))
+                                              or not math.isfinite(threshold)
+                                              or threshold < MIN_PROFILE_THRESHOLD_MS):
+                    return jsonify({'error': f'threshold_ms must be a number >= {MIN_PROFILE_THRESHOLD_MS}'}), 400
+                profiler.enable(threshold / 1000.0 if threshold is not None else None)
+            else:
+                profiler.disable()
+        return jsonify({
+            'enabled': profiler.enabled,
+            'threshold_ms': profiler.threshold * 1000.0,
+            'max_files': profiler.max_files,
+            'output_dir': os.path.abspath(profiler.output_dir)
+        })
+    
+    if socketio is not None:
+        emit = socketio.emit
+        
+        @functools.wraps(emit)
+        def counted_emit(event, *args, **kwargs):
+            SOCKET_EVENTS.inc(direction='out', event=event)
+            return emit(event, *args, **kwargs)
+        
+        socketio.emit = counted_emit
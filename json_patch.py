@@ -0,0 +1,197 @@
+import copy
+import re
+from typing import Any, Dict, List, Tuple
+
+# Array-element shorthand accepted alongside RFC 6902 operations
+SHORTHAND_OPS = ('append', 'modify', 'delete')
+
+# RFC 6901 array index: ASCII digits without leading zeros
+_ARRAY_INDEX = re.compile(r'0|[1-9][0-9]*')
+
+
+class JsonPatchError(ValueError):
+    """Raised when a patch is malformed or cannot be applied"""
+
+
+class JsonPatchConflict(JsonPatchError):
+    """Raised when a ``test`` operation fails against the current document"""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split an RFC 6901 JSON Pointer into unescaped reference tokens"""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f'Invalid JSON pointer: {pointer!r}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container: List, token: str, allow_end: bool) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not _ARRAY_INDEX.fullmatch(token):
+        raise JsonPatchError(f'Invalid array index: {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f'Array index out of range: {index}')
+    return index
+
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    """Walk to the container holding the last token"""
+    if not tokens:
+        raise JsonPatchError('Operations on the document root are not supported')
+    node = document
+    for token in tokens[:-1]:
+        if isinstance(node, list):
+            node = node[_array_index(node, token, allow_end=False)]
+        elif isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f'Path not found: /{"/".join(tokens)}')
+            node = node[token]
+        else:
+            raise JsonPatchError(f'Path not found: /{"/".join(tokens)}')
+    return node, tokens[-1]
+
+
+def _get(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        return document
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, list):
+        return parent[_array_index(parent, token, allow_end=False)]
+    if isinstance(parent, dict) and token in parent:
+        return parent[token]
+    raise JsonPatchError(f'Path not found: /{"/".join(tokens)}')
+
+
+def _add(document: Any, tokens: List[str], value: Any):
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, token, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise JsonPatchError(f'Cannot add to /{"/".join(tokens)}')
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, token, allow_end=False))
+    if isinstance(parent, dict) and token in parent:
+        return parent.pop(token)
+    raise JsonPatchError(f'Path not found: /{"/".join(tokens)}')
+
+
+def expand_shorthand(operation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Translate an array-element shorthand operation into RFC 6902 operations
+    
+    ``{"op": "append", "collection": "causes", "value": {...}}`` adds an
+    element, ``{"op": "modify", "collection": "causes", "index": 2,
+    "value": {"type": "latent"}}`` sets the given fields of one element and
+    ``{"op": "delete", "collection": "causes", "index": 2}`` removes it.
+    """
+    collection = operation.get('collection')
+    if not isinstance(collection, str) or not collection:
+        raise JsonPatchError(f"'{operation['op']}' requires a 'collection'")
+    base = '/' + collection.replace('~', '~0').replace('/', '~1')
+    
+    if operation['op'] == 'append':
+        if 'value' not in operation:
+            raise JsonPatchError("'append' requires a 'value'")
+        return [{'op': 'add', 'path': f'{base}/-', 'value': operation['value']}]
+    
+    index = operation.get('index')
+    if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+        raise JsonPatchError(f"'{operation['op']}' requires a non-negative integer 'index'")
+    if operation['op'] == 'delete':
+        return [{'op': 'remove', 'path': f'{base}/{index}'}]
+    
+    fields = operation.get('value')
+    if not isinstance(fields, dict):
+        raise JsonPatchError("'modify' requires an object 'value'")
+    return [
+        {'op': 'add', 'path': f'{base}/{index}/' + key.replace('~', '~0').replace('/', '~1'), 'value': value}
+        for key, value in fields.items()
+    ]
+
+
+def normalize_patch(patch: Any) -> List[Dict[str, Any]]:
+    """Validate a patch and return it as plain RFC 6902 operations"""
+    if not isinstance(patch, list):
+        raise JsonPatchError('A patch must be a list of operations')
+    
+    operations = []
+    for operation in patch:
+        if not isinstance(operation, dict) or 'op' not in operation:
+            raise JsonPatchError('Each operation must be an object with an "op"')
+        op = operation['op']
+        if op in SHORTHAND_OPS:
+            operations.extend(expand_shorthand(operation))
+            continue
+        if op not in ('add', 'remove', 'replace', 'move', 'copy', 'test'):
+            raise JsonPatchError(f'Unsupported operation: {op!r}')
+        if not isinstance(operation.get('path'), str):
+            raise JsonPatchError(f"'{op}' requires a string 'path'")
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f"'{op}' requires a 'value'")
+        if op in ('move', 'copy') and not isinstance(operation.get('from'), str):
+            raise JsonPatchError(f"'{op}' requires a string 'from'")
+        operations.append({k: operation[k] for k in ('op', 'path', 'from', 'value') if k in operation})
+    return operations
+
+
+def touched_paths(operations: List[Dict[str, Any]]) -> List[str]:
+    """Every pointer an operation list reads or writes"""
+    paths = []
+    for operation in operations:
+        paths.append(operation['path'])
+        if 'from' in operation:
+            paths.append(operation['from'])
+    return paths
+
+
+def is_position_independent(operation: Dict[str, Any]) -> bool:
+    """Whether the operation means the same thing however the arrays have shifted
+    
+    Appends (``/-``), guards and writes to object members commute with
+    concurrent edits; anything addressing an existing array element by
+    position does not.
+    """
+    if operation['op'] == 'test':
+        return True
+    for pointer in [operation['path']] + ([operation['from']] if 'from' in operation else []):
+        tokens = parse_pointer(pointer)
+        inner = tokens[:-1] if operation['op'] == 'add' and tokens and tokens[-1] == '-' else tokens
+        if any(_ARRAY_INDEX.fullmatch(token) for token in inner):
+            return False
+        if operation['op'] != 'add' and tokens and tokens[-1] == '-':
+            return False
+    return True
+
+
+def apply_patch(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply normalized operations atomically, returning the patched copy"""
+    result = copy.deepcopy(document)
+    for operation in operations:
+        op = operation['op']
+        tokens = parse_pointer(operation['path'])
+        if op == 'add':
+            _add(result, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(result, tokens)
+        elif op == 'replace':
+            _remove(result, tokens)
+            _add(result, tokens, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            source = parse_pointer(operation['from'])
+            if tokens[:len(source)] == source and tokens != source:
+                raise JsonPatchError('Cannot move a value into one of its children')
+            _add(result, tokens, _remove(result, source))
+        elif op == 'copy':
+            _add(result, tokens, copy.deepcopy(_get(result, parse_pointer(operation['from']))))
+        elif op == 'test':
+            if _get(result, tokens) != operation['value']:
+                raise JsonPatchConflict(f'Test failed at {operation["path"]}')
+    return result
@@ -0,0 +1,89 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+# System archetype vocabularies used to label problems for the pattern classifier
+ARCHETYPE_KEYWORDS = {
+    'limits_to_growth': ['growth', 'limit', 'constraint', 'capacity', 'saturation'],
+    'tragedy_of_commons': ['shared', 'resource', 'depletion', 'overuse', 'competition'],
+    'escalation': ['competition', 'arms_race', 'retaliation', 'escalation', 'conflict'],
+    'fixes_that_fail': ['solution', 'unintended', 'consequence', 'side_effect', 'worsen'],
+    'shifting_the_burden': ['dependency', 'symptom', 'quick_fix', 'fundamental', 'weaken'],
+    'success_to_successful': ['advantage', 'resource_allocation', 'rich_get_richer', 'inequality']
+}
+
+# Indicators for the impact categories offered in the UI
+IMPACT_TYPE_KEYWORDS = {
+    'technical': ['software', 'hardware', 'system', 'technology', 'data', 'network'],
+    'business': ['revenue', 'cost', 'profit', 'market', 'customer', 'sales'],
+    'operational': ['process', 'workflow', 'efficiency', 'productivity', 'operation'],
+    'environmental': ['environment', 'pollution', 'energy', 'sustainability', 'climate'],
+    'health': ['health', 'safety', 'medical', 'patient', 'wellness'],
+    'educational': ['education', 'learning', 'student', 'teacher', 'curriculum']
+}
+
+# Direction-of-change words used to guess link polarity
+POLARITY_KEYWORDS = {
+    'growth': ['increase', 'grow', 'expand'],
+    'improvement': ['improve'],
+    'decline': ['decrease', 'reduce', 'limit', 'constraint']
+}
+
+
+class KeywordMatcher:
+    """Match several keyword vocabularies against text in a single pass
+    
+    All keywords are compiled into one alternation regex. A keyword matches
+    at the start of a word and absorbs the rest of it, so ``limit`` hits
+    "limits" and "limited" but not "delimit". Longer keywords are tried
+    first; a hit also counts for every shorter keyword that is its prefix,
+    so "growth" reports both ``growth`` and ``grow``.
+    """
+    
+    def __init__(self, vocabularies: Dict[str, Dict[str, List[str]]]):
+        self.vocabularies = vocabularies
+        
+        # keyword -> [(vocabulary, label), ...]; one keyword may feed several labels
+        self._targets: Dict[str, List[Tuple[str, str]]] = {}
+        for vocabulary, labels in vocabularies.items():
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    self._targets.setdefault(keyword.lower(), []).append((vocabulary, label))
+        
+        # keyword -> itself plus every shorter keyword it starts with
+        self._prefixes = {
+            keyword: [other for other in self._targets if keyword.startswith(other)]
+            for keyword in self._targets
+        }
+        
+        alternation = '|'.join(re.escape(k) for k in sorted(self._targets, key=len, reverse=True))
+        self._pattern = re.compile(rf'\b({alternation})\w*', re.IGNORECASE)
+    
+    def scan(self, text: str) -> Dict[str, Dict[str, Set[str]]]:
+        """Return the distinct keywords found in ``text`` per vocabulary and label"""
+        hits: Dict[str, Dict[str, Set[str]]] = {vocabulary: {} for vocabulary in self.vocabularies}
+        for match in set(m.lower() for m in self._pattern.findall(text)):
+            for keyword in self._prefixes[match]:
+                for vocabulary, label in self._targets[keyword]:
+                    hits[vocabulary].setdefault(label, set()).add(keyword)
+        return hits
+    
+    def label_scores(self, text: str, vocabulary: str) -> Dict[str, int]:
+        """Number of distinct keywords of each label in ``vocabulary`` found in ``text``"""
+        found = self.scan(text)[vocabulary]
+        return {label: len(found.get(label, ())) for label in self.vocabularies[vocabulary]}
+    
+    def best_label(self, text: str, vocabulary: str, default: str = 'unknown') -> str:
+        """Label with the most distinct keyword hits, ties going to the earlier label"""
+        label, max_score = default, 0
+        for candidate, score in self.label_scores(text, vocabulary).items():
+            if score > max_score:
+                label, max_score = candidate, score
+        return label
+
+
+# Shared matcher over every built-in vocabulary
+default_matcher = KeywordMatcher({
+    'archetype': ARCHETYPE_KEYWORDS,
+    'impact_type': IMPACT_TYPE_KEYWORDS,
+    'polarity': POLARITY_KEYWORDS
+})
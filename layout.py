@@ -0,0 +1,267 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import shortest_path
+
+from loop_discovery import _node_key
+
+# Target on-screen length of a one-hop edge, matching the D3 link distance
+EDGE_LENGTH = 100.0
+
+# Landmark nodes for the pivot-MDS starting layout
+MAX_PIVOTS = 50
+
+# Larger diagrams keep the pivot-MDS (or seeded) layout; stress needs all-pairs distances
+MAX_STRESS_NODES = 2000
+
+# Majorization sweeps for a fresh layout and for one seeded from the previous version
+COLD_ITERATIONS = 300
+WARM_ITERATIONS = 60
+TOLERANCE = 1e-4
+
+
+def _diagram_graph(problem: Dict) -> Tuple[List[str], List[str], List[Tuple[int, int, str]]]:
+    """Nodes and links of the problem diagram as drawn by the D3 visualizer
+    
+    Node ids follow the client (``problem``, ``cause-0``, ``impact-2``,
+    ``loop-1``). Each node also gets a content key (kind plus normalized
+    description, numbered when repeated) that survives inserts and deletes
+    elsewhere in the lists, so positions can be carried across versions.
+    Loop ``relationships`` are resolved to causes, impacts or the problem
+    by description; unresolved steps are skipped.
+    """
+    ids = ['problem']
+    keys = ['problem']
+    links: List[Tuple[int, int, str]] = []
+    by_description = {_node_key(problem.get('title') or ''): 0}
+    seen: Dict[str, int] = {}
+    
+    def add_node(node_id, kind, description):
+        key = f'{kind}:{_node_key(description or "")}'
+        seen[key] = seen.get(key, 0) + 1
+        ids.append(node_id)
+        keys.append(f'{key}#{seen[key]}')
+        return len(ids) - 1
+    
+    for i, cause in enumerate(problem.get('causes') or []):
+        node = add_node(f'cause-{i}', 'cause', cause.get('description'))
+        by_description.setdefault(_node_key(cause.get('description') or ''), node)
+        links.append((node, 0, 'causal'))
+    for i, impact in enumerate(problem.get('impacts') or []):
+        node = add_node(f'impact-{i}', 'impact', impact.get('description'))
+        by_description.setdefault(_node_key(impact.get('description') or ''), node)
+        links.append((0, node, 'causal'))
+    
+    for i, loop in enumerate(problem.get('feedback_loops') or []):
+        node = add_node(f'loop-{i}', 'loop', loop.get('description'))
+        chain = [by_description.get(_node_key(step)) for step in loop.get('relationships') or []]
+        chain = [member for member in chain if member is not None]
+        for source, target in zip(chain, chain[1:]):
+            if source != target:
+                links.append((source, target, loop.get('type') or 'causal'))
+        for member in dict.fromkeys(chain):
+            links.append((node, member, 'membership'))
+    
+    return ids, keys, links
+
+
+def _adjacency(n: int, links: List[Tuple[int, int, str]]) -> sparse.csr_matrix:
+    rows = [source for source, _, _ in links]
+    cols = [target for _, target, _ in links]
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+
+def _hop_distances(adjacency: sparse.csr_matrix, indices: Optional[List[int]] = None) -> np.ndarray:
+    """Hop distances on the undirected diagram, from every node or just ``indices``
+    
+    Separate components are placed one hop past the largest finite distance.
+    """
+    distances = np.atleast_2d(shortest_path(adjacency, directed=False, unweighted=True, indices=indices))
+    finite = np.isfinite(distances)
+    distances[~finite] = distances[finite].max() + 1 if finite.any() else 1
+    return distances * EDGE_LENGTH
+
+
+def _pivot_mds(adjacency: sparse.csr_matrix) -> np.ndarray:
+    """Classical MDS against a max-min spread of landmark nodes; O(n * pivots)"""
+    n = adjacency.shape[0]
+    pivots = [0]
+    rows = [_hop_distances(adjacency, [0])[0]]
+    nearest = rows[0].copy()
+    for _ in range(min(n, MAX_PIVOTS) - 1):
+        pivots.append(int(np.argmax(nearest)))
+        rows.append(_hop_distances(adjacency, [pivots[-1]])[0])
+        nearest = np.minimum(nearest, rows[-1])
+    
+    squared = np.array(rows).T ** 2
+    centered = -0.5 * (squared - squared.mean(axis=0) - squared.mean(axis=1, keepdims=True) + squared.mean())
+    u, s, _ = np.linalg.svd(centered, full_matrices=False)
+    positions = np.zeros((n, 2))
+    k = min(2, len(s))
+    positions[:, :k] = u[:, :k] * s[:k]
+    return positions
+
+
+def _pairwise(positions: np.ndarray) -> np.ndarray:
+    squared = (positions ** 2).sum(axis=1)
+    gram = squared[:, None] + squared[None, :] - 2 * positions @ positions.T
+    return np.sqrt(np.maximum(gram, 0.0))
+
+
+def _majorize(positions: np.ndarray, distances: np.ndarray, max_iter: int) -> Tuple[np.ndarray, float, int]:
+    """Stress majorization with 1/d^2 weights, updating every node at once
+    
+    Each sweep moves node i to the weighted mean over j of where j would
+    put it at exactly the graph distance d_ij, which is the localized
+    SMACOF update. All sums are (n x n) matrix products.
+    """
+    with np.errstate(divide='ignore'):
+        weights = np.where(distances > 0, 1.0 / distances ** 2, 0.0)
+    weight_sums = weights.sum(axis=1, keepdims=True)
+    weight_sums[weight_sums == 0] = 1.0
+    weighted_distances = weights * distances
+    
+    stress = np.inf
+    iterations = 0
+    while True:
+        current = _pairwise(positions)
+        new_stress = float((weights * (current - distances) ** 2).sum() / 2)
+        if iterations == max_iter or stress - new_stress <= TOLERANCE * max(new_stress, 1e-12):
+            return positions, new_stress, iterations
+        stress = new_stress
+        iterations += 1
+        
+        pull = weighted_distances / np.maximum(current, 1e-9)
+        np.fill_diagonal(pull, 0.0)
+        positions = (weights @ positions + pull.sum(axis=1, keepdims=True) * positions - pull @ positions) / weight_sums
+
+
+def _align(positions: np.ndarray, anchors: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Rotate and translate onto the previous positions of the carried-over nodes"""
+    if mask.sum() < 2:
+        return positions + (anchors[mask].mean(axis=0) - positions[mask].mean(axis=0) if mask.any() else 0)
+    source = positions[mask] - positions[mask].mean(axis=0)
+    target = anchors[mask] - anchors[mask].mean(axis=0)
+    u, _, vt = np.linalg.svd(source.T @ target)
+    rotation = u @ vt
+    return (positions - positions[mask].mean(axis=0)) @ rotation + anchors[mask].mean(axis=0)
+
+
+class DiagramLayout:
+    """Server-side node positions for problem diagrams, cached per problem version
+    
+    :meth:`compute` is a pure function of the problem and the previous
+    version's positions, so it can run in the compute pool; the cache and
+    the previous positions live with the caller's instance. An edited
+    problem is laid out starting from where its surviving nodes were,
+    which keeps the picture stable and converges in a fraction of the
+    sweeps a fresh layout needs.
+    """
+    
+    def __init__(self, cache_size: int = 256):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _version(problem: Dict) -> Tuple[Any, Any]:
+        return (problem.get('version'), problem.get('updated_at'))
+    
+    def cached(self, problem: Dict) -> Optional[Dict[str, Any]]:
+        """The layout of exactly this problem version, if one was computed"""
+        with self._lock:
+            entry = self._cache.get(problem.get('id'))
+            if entry is None or entry['version'] != self._version(problem):
+                return None
+            self._cache.move_to_end(problem.get('id'))
+            return entry['layout']
+    
+    def previous(self, problem_id: Any) -> Optional[Dict[str, List[float]]]:
+        """Positions by content key from the last layout of the problem, to seed the next one"""
+        with self._lock:
+            entry = self._cache.get(problem_id)
+            return entry['seeds'] if entry else None
+    
+    def store(self, problem: Dict, computed: Tuple[Dict[str, Any], Dict[str, List[float]]]) -> Dict[str, Any]:
+        layout, seeds = computed
+        with self._lock:
+            self._cache[problem.get('id')] = {'version': self._version(problem), 'layout': layout, 'seeds': seeds}
+            self._cache.move_to_end(problem.get('id'))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return layout
+    
+    def forget(self, problem_id: Any):
+        with self._lock:
+            self._cache.pop(problem_id, None)
+    
+    def compute(self, problem: Dict, previous: Optional[Dict[str, List[float]]] = None
+                ) -> Tuple[Dict[str, Any], Dict[str, List[float]]]:
+        """Lay out a problem diagram; returns the response body and the seeds for the next version"""
+        ids, keys, links = _diagram_graph(problem)
+        n = len(ids)
+        adjacency = _adjacency(n, links)
+        previous = previous or {}
+        
+        carried = np.array([key in previous for key in keys])
+        if carried.any():
+            positions = self._seed_positions(keys, links, previous, carried)
+            max_iter = WARM_ITERATIONS
+        else:
+            positions = _pivot_mds(adjacency)
+            max_iter = COLD_ITERATIONS
+        
+        stress, iterations = None, 0
+        if n <= MAX_STRESS_NODES:
+            # Tiny deterministic offsets so coincident starting points can separate
+            positions = positions + np.random.default_rng(n).uniform(-1e-3, 1e-3, positions.shape) * EDGE_LENGTH
+            positions, stress, iterations = _majorize(positions, _hop_distances(adjacency), max_iter)
+        
+        if carried.any():
+            anchors = np.array([previous[key] if key in previous else (0.0, 0.0) for key in keys], dtype=float)
+            positions = _align(positions, anchors, carried)
+        else:
+            positions -= positions[0]
+        
+        layout = {
+            "problem_id": problem.get('id'),
+            "version": problem.get('version'),
+            "nodes": [{"id": node_id, "x": float(x), "y": float(y)} for node_id, (x, y) in zip(ids, positions)],
+            "links": [{"source": ids[source], "target": ids[target], "type": kind} for source, target, kind in links],
+            "bounds": {
+                "min_x": float(positions[:, 0].min()), "min_y": float(positions[:, 1].min()),
+                "max_x": float(positions[:, 0].max()), "max_y": float(positions[:, 1].max())
+            },
+            "stress": stress,
+            "iterations": iterations,
+            "incremental": bool(carried.any()),
+            "reused_nodes": int(carried.sum())
+        }
+        seeds = {key: [float(x), float(y)] for key, (x, y) in zip(keys, positions)}
+        return layout, seeds
+    
+    @staticmethod
+    def _seed_positions(keys: List[str], links: List[Tuple[int, int, str]],
+                        previous: Dict[str, List[float]], carried: np.ndarray) -> np.ndarray:
+        """Previous positions for surviving nodes; new nodes start at the mean of their placed neighbours"""
+        n = len(keys)
+        positions = np.array([previous[key] if key in previous else (0.0, 0.0) for key in keys], dtype=float)
+        placed = carried.copy()
+        neighbours: List[List[int]] = [[] for _ in range(n)]
+        for source, target, _ in links:
+            neighbours[source].append(target)
+            neighbours[target].append(source)
+        
+        # Place new nodes outward from the carried ones, a ring of the graph at a time
+        while not placed.all():
+            ring = [i for i in np.flatnonzero(~placed) if any(placed[j] for j in neighbours[i])]
+            if not ring:
+                positions[~placed] = positions[placed].mean(axis=0)
+                break
+            for i in ring:
+                positions[i] = positions[[j for j in neighbours[i] if placed[j]]].mean(axis=0)
+            placed[ring] = True
+        return positions
@@ -0,0 +1,329 @@
+import re
+import time
+from typing import Dict, List, Tuple, Any, Optional
+
+from keyword_matcher import POLARITY_KEYWORDS, default_matcher
+
+PROBLEM_NODE = '__problem__'
+
+# Edge confidence by provenance: drawn by the user, implied by the problem
+# structure (cause -> problem -> impact), or inferred from shared wording
+EDGE_WEIGHTS = {'explicit': 1.0, 'structural': 0.9, 'inferred': 0.5}
+
+# Words too generic to link an impact back to a cause
+_STOPWORDS = {
+    'about', 'after', 'again', 'being', 'from', 'have', 'high', 'into', 'less', 'level',
+    'levels', 'more', 'over', 'rate', 'than', 'that', 'their', 'there', 'this', 'under',
+    'very', 'when', 'with', 'without'
+}
+_TOKEN = re.compile(r'[a-z][a-z0-9]{3,}')
+
+# Direction words ("increased", "reduction", "limits") say how a variable moves,
+# not what it is, so they never link an impact to a cause. A trailing "e" is
+# dropped so the stem also covers "-ing" and "-ion" forms.
+_POLARITY_STEMS = tuple(sorted({keyword.rstrip('e') for keywords in POLARITY_KEYWORDS.values()
+                                for keyword in keywords}))
+
+
+def _content_tokens(text: str) -> set:
+    return {token for token in set(_TOKEN.findall(str(text).lower())) - _STOPWORDS
+            if not token.startswith(_POLARITY_STEMS)}
+
+
+def _node_key(name: str) -> str:
+    return ' '.join(str(name).lower().split())
+
+
+def _edge_sign(target_label: str) -> int:
+    """-1 if the target is described as falling, +1 otherwise"""
+    return -1 if 'decline' in default_matcher.scan(str(target_label))['polarity'] else 1
+
+
+class SignedGraph:
+    """Directed graph with signed, weighted edges between named variables"""
+    
+    def __init__(self):
+        self.labels: Dict[str, str] = {}
+        self.kinds: Dict[str, str] = {}
+        self.edges: Dict[str, Dict[str, Tuple[int, float, str]]] = {}
+    
+    def add_node(self, key: str, label: str, kind: str = 'variable'):
+        if key not in self.labels:
+            self.labels[key] = label
+            self.kinds[key] = kind
+            self.edges[key] = {}
+    
+    def add_edge(self, source: str, target: str, sign: int, kind: str):
+        """Add an edge, keeping the most trusted one if it already exists"""
+        weight = EDGE_WEIGHTS[kind]
+        current = self.edges[source].get(target)
+        if current is None or weight > current[1]:
+            self.edges[source][target] = (sign, weight, kind)
+    
+    @property
+    def edge_count(self) -> int:
+        return sum(len(targets) for targets in self.edges.values())
+
+
+def build_signed_graph(problem: Dict) -> SignedGraph:
+    """Build the signed causal graph of a problem
+    
+    Causes point at the problem node and the problem points at its impacts.
+    Each feedback loop's ``relationships`` chain adds explicit links between
+    consecutive variables. Impacts are linked back to causes that share a
+    content word with them, which is what closes most loops in practice.
+    Links into variables described as falling ("reduced demand") are negative.
+    """
+    graph = SignedGraph()
+    graph.add_node(PROBLEM_NODE, problem.get('title') or 'Problem', 'problem')
+    
+    causes = [c.get('description', '') for c in problem.get('causes', []) if c.get('description')]
+    impacts = [i.get('description', '') for i in problem.get('impacts', []) if i.get('description')]
+    
+    for cause in causes:
+        graph.add_node(_node_key(cause), cause, 'cause')
+        graph.add_edge(_node_key(cause), PROBLEM_NODE, 1, 'structural')
+    for impact in impacts:
+        graph.add_node(_node_key(impact), impact, 'impact')
+        graph.add_edge(PROBLEM_NODE, _node_key(impact), _edge_sign(impact), 'structural')
+    
+    for loop in problem.get('feedback_loops', []):
+        chain = [r for r in loop.get('relationships') or [] if str(r).strip()]
+        for source, target in zip(chain, chain[1:]):
+            graph.add_node(_node_key(source), source)
+            graph.add_node(_node_key(target), target)
+            graph.add_edge(_node_key(source), _node_key(target), _edge_sign(target), 'explicit')
+    
+    # Inverted index of cause words so each impact only meets the causes it shares a word with
+    causes_by_token: Dict[str, List[str]] = {}
+    for cause in causes:
+        for token in _content_tokens(cause):
+            causes_by_token.setdefault(token, []).append(cause)
+    
+    for impact in impacts:
+        impact_key = _node_key(impact)
+        sign = _edge_sign(impact)
+        for token in _content_tokens(impact):
+            for cause in causes_by_token.get(token, []):
+                if _node_key(cause) != impact_key:
+                    graph.add_edge(impact_key, _node_key(cause), sign, 'inferred')
+    
+    return graph
+
+
+def _strongly_connected_components(nodes: List[str], edges: Dict[str, Dict]) -> List[List[str]]:
+    """Iterative Tarjan's algorithm restricted to ``nodes``"""
+    allowed = set(nodes)
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components = []
+    counter = 0
+    
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(edges[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        
+        while work:
+            node, successors = work[-1]
+            advanced = False
+            for successor in successors:
+                if successor not in allowed:
+                    continue
+                if successor not in index:
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges[successor])))
+                    advanced = True
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            if advanced:
+                continue
+            
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    
+    return components
+
+
+def simple_cycles(graph: SignedGraph, max_length: int = 8, max_cycles: int = 500,
+                  time_budget: float = 0.25) -> Tuple[List[List[str]], bool]:
+    """Enumerate simple cycles with Johnson's algorithm
+    
+    Cycles longer than ``max_length`` are skipped; a depth cut-off is treated
+    like a found circuit when unblocking, which keeps the search complete
+    for the bounded lengths. Stops after ``max_cycles`` cycles or
+    ``time_budget`` seconds. Returns the cycles and whether the search was
+    cut short.
+    """
+    deadline = time.perf_counter() + time_budget
+    cycles: List[List[str]] = []
+    edges = graph.edges
+    
+    # Self-loops are cycles of length one and are handled outside the search
+    for node, targets in edges.items():
+        if node in targets:
+            cycles.append([node])
+    
+    # Cycles never leave a strongly connected component, so each is searched
+    # on its own; within it every start node is retired once its cycles are out
+    for component in _strongly_connected_components(list(edges), edges):
+        if len(component) < 2:
+            continue
+        remaining = set(component)
+        
+        for start in component:
+            blocked = {start}
+            blocked_by: Dict[str, set] = {}
+            path = [start]
+            
+            # Each frame: [node, successor iterator, whether a circuit or cut-off was reached]
+            frames = [[start, iter(edges[start]), False]]
+            while frames:
+                if len(cycles) >= max_cycles or time.perf_counter() > deadline:
+                    return cycles, True
+                
+                frame = frames[-1]
+                successor = next(frame[1], None)
+                if successor is not None:
+                    if successor == start:
+                        if len(path) > 1:
+                            cycles.append(list(path))
+                        frame[2] = True
+                    elif successor in remaining and successor not in blocked:
+                        if len(path) >= max_length:
+                            frame[2] = True
+                        else:
+                            path.append(successor)
+                            blocked.add(successor)
+                            frames.append([successor, iter(edges[successor]), False])
+                    continue
+                
+                frames.pop()
+                path.pop()
+                node = frame[0]
+                if frame[2]:
+                    # Unblock the node and, transitively, everything waiting on it
+                    todo = [node]
+                    while todo:
+                        current = todo.pop()
+                        if current in blocked:
+                            blocked.discard(current)
+                            todo.extend(blocked_by.pop(current, ()))
+                    if frames:
+                        frames[-1][2] = True
+                else:
+                    for neighbour in edges[node]:
+                        if neighbour in remaining:
+                            blocked_by.setdefault(neighbour, set()).add(node)
+            
+            remaining.discard(start)
+    
+    return cycles, False
+
+
+def _canonical(cycle: List[str]) -> Tuple[str, ...]:
+    pivot = cycle.index(min(cycle))
+    return tuple(cycle[pivot:] + cycle[:pivot])
+
+
+def find_loops(graph: SignedGraph, max_length: int = 8, max_cycles: int = 500,
+               time_budget: float = 0.25) -> Tuple[List[List[str]], bool]:
+    """Enumerate cycles shortest-first within a shared budget
+    
+    Iterative deepening: short loops are cheap to find and rank first, so
+    the length bound grows only while budget remains.
+    """
+    deadline = time.perf_counter() + time_budget
+    found: Dict[Tuple[str, ...], List[str]] = {}
+    truncated = False
+    for length_bound in range(2, max_length + 1):
+        remaining_time = deadline - time.perf_counter()
+        if remaining_time <= 0:
+            truncated = True
+            break
+        cycles, truncated = simple_cycles(graph, length_bound, max_cycles, remaining_time)
+        for cycle in cycles:
+            found.setdefault(_canonical(cycle), cycle)
+        if truncated:
+            break
+    return list(found.values()), truncated
+
+
+def loop_links(graph: SignedGraph, cycle: List[str]) -> List[Tuple[int, float, str]]:
+    """The (sign, weight, kind) of each link around ``cycle``"""
+    return [graph.edges[source][target] for source, target in zip(cycle, cycle[1:] + cycle[:1])]
+
+
+def discover_loops(problem: Dict, max_length: int = 8, max_cycles: int = 500,
+                   time_budget: float = 0.25, limit: Optional[int] = 5) -> Dict[str, Any]:
+    """Find closed feedback loops in a problem's causal graph and rank them
+    
+    Polarity follows the parity of negative links: an even number makes a
+    reinforcing loop, an odd number a balancing one. Loops the user already
+    drew are counted but not suggested again. Ranking favours well-supported
+    links, then shorter loops.
+    """
+    graph = build_signed_graph(problem)
+    cycles, truncated = find_loops(graph, max_length, max_cycles, time_budget)
+    
+    known = set()
+    for loop in problem.get('feedback_loops', []):
+        chain = [_node_key(r) for r in loop.get('relationships') or [] if str(r).strip()]
+        if len(chain) > 1 and chain[0] == chain[-1]:
+            chain = chain[:-1]
+        if chain:
+            known.add(_canonical(chain))
+    
+    suggestions = []
+    known_found = 0
+    for cycle in cycles:
+        if _canonical(cycle) in known:
+            known_found += 1
+            continue
+        
+        links = loop_links(graph, cycle)
+        negative_links = sum(1 for sign, _, _ in links if sign < 0)
+        confidence = 1.0
+        for _, weight, _ in links:
+            confidence *= weight
+        labels = [graph.labels[node] for node in cycle]
+        
+        suggestions.append({
+            "type": "balancing" if negative_links % 2 else "reinforcing",
+            "description": " → ".join(labels + labels[:1]),
+            "relationships": labels + labels[:1],
+            "length": len(cycle),
+            "negative_links": negative_links,
+            "confidence": round(confidence, 3)
+        })
+    
+    suggestions.sort(key=lambda s: (-s['confidence'], s['length']))
+    
+    return {
+        "suggested_loops": suggestions[:limit] if limit is not None else suggestions,
+        "total_suggestions": len(suggestions),
+        "known_loops_found": known_found,
+        "graph": {"nodes": len(graph.labels), "edges": graph.edge_count},
+        "truncated": truncated
+    }
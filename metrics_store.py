@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from compact_model import DERIVED_COLUMNS
+from compute_pool import run_blocking
+from predictive_models import TREND_METRICS, problem_trend_metrics
+
+# Stored columns: the number of problems plus every per-problem trend metric
+COLUMNS = ('problem_count',) + TREND_METRICS
+
+# Derived-block column each trend metric is read from
+TREND_SOURCES = {
+    'causes_count': 'counts.causes',
+    'impacts_count': 'counts.impacts',
+    'feedback_loops_count': 'counts.feedback_loops',
+    'remediations_count': 'counts.remediations',
+    'complexity_score': 'complexity_score',
+    'reinforcing_loops': 'loop_polarity.reinforcing',
+    'balancing_loops': 'loop_polarity.balancing'
+}
+
+
+def store_totals(store) -> np.ndarray:
+    """Current COLUMNS totals of a ``ProblemStore``, from its derived blocks"""
+    sums = dict(zip(DERIVED_COLUMNS, store.derived_matrix().sum(axis=0)))
+    return np.array([len(store)] + [sums.get(TREND_SOURCES[name], 0.0) for name in TREND_METRICS])
+
+
+class MetricsLog:
+    """Append-only log of per-day store metrics backed by SQLite
+    
+    Every create, update and delete adds the net change it made to the
+    store's totals into that day's row, so a day's row is the sum of all
+    deltas recorded on it and the running sum over days gives the store
+    totals over time. Readers pay per day, not per problem or per edit.
+    
+    Writes made to the data file by anything other than the app are not
+    seen as events; ``reconcile`` books the difference they made as one
+    correcting row on the day it is noticed.
+    
+    SQLite calls run through ``run_blocking``, like the data file I/O, so
+    commits never stall the event loop in the cooperative serving modes.
+    """
+    
+    def __init__(self, db_path: str = "metrics_log.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        
+        def create(conn):
+            column_defs = ', '.join(f'{name} REAL NOT NULL DEFAULT 0' for name in COLUMNS)
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS daily_metrics ('
+                f'day TEXT PRIMARY KEY, events INTEGER NOT NULL DEFAULT 0, {column_defs})'
+            )
+            conn.commit()
+        self._run(create)
+    
+    def _run(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run ``work`` on a fresh connection; the lock is taken by the caller, the I/O off the event loop"""
+        with self._lock:
+            return run_blocking(self._with_connection, work)
+    
+    def _with_connection(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return work(conn)
+    
+    def record_change(self, before: Optional[Dict], after: Optional[Dict], day: Optional[str] = None):
+        """Record the change from ``before`` to ``after`` (None for create/delete)"""
+        delta = np.zeros(len(COLUMNS))
+        if after is not None:
+            delta += (1.0,) + tuple(problem_trend_metrics(after))
+        if before is not None:
+            delta -= (1.0,) + tuple(problem_trend_metrics(before))
+        
+        self._add_rows([(day or date.today().isoformat(), 1, *delta.tolist())])
+    
+    def backfill(self, series: Dict[str, np.ndarray]):
+        """Seed the log from a daily series such as ``prepare_time_series_data`` output"""
+        days = np.datetime_as_string(series['day']).tolist()
+        events = series['problem_count'].astype(int).tolist()
+        values = np.column_stack([series[name] for name in COLUMNS]).tolist() if days else []
+        
+        self._add_rows([(day, n, *row) for day, n, row in zip(days, events, values)])
+    
+    def reconcile(self, totals: np.ndarray, day: Optional[str] = None) -> bool:
+        """Record whatever separates the logged totals from ``totals``; True if a row was added"""
+        def reconcile(conn):
+            logged = conn.execute(
+                f'SELECT {", ".join(f"COALESCE(SUM({name}), 0)" for name in COLUMNS)} FROM daily_metrics'
+            ).fetchone()
+            delta = np.asarray(totals, dtype=float) - np.array(logged, dtype=float)
+            if np.abs(delta).max() < 1e-6:
+                return False
+            self._insert(conn, [(day or date.today().isoformat(), 1, *delta.tolist())])
+            return True
+        return self._run(reconcile)
+    
+    def is_empty(self) -> bool:
+        """Whether any change has been recorded yet"""
+        return self._run(lambda conn: conn.execute('SELECT 1 FROM daily_metrics LIMIT 1').fetchone() is None)
+    
+    def daily_series(self) -> Dict[str, np.ndarray]:
+        """Return the per-day net changes as columnar arrays ordered by day"""
+        rows = self._run(lambda conn: conn.execute(
+            f'SELECT day, events, {", ".join(COLUMNS)} FROM daily_metrics ORDER BY day'
+        ).fetchall())
+        
+        values = np.array([row[2:] for row in rows], dtype=float).reshape(len(rows), len(COLUMNS))
+        series = {
+            'day': np.array([row[0] for row in rows], dtype='datetime64[D]'),
+            'events': np.array([row[1] for row in rows], dtype=np.int64)
+        }
+        for column, name in enumerate(COLUMNS):
+            series[name] = values[:, column]
+        return series
+    
+    def _add_rows(self, rows: List[tuple]):
+        """Add each row's values into the matching day, creating it if needed"""
+        if not rows:
+            return
+        
+        self._run(lambda conn: self._insert(conn, rows))
+    
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: List[tuple]):
+        placeholders = ', '.join('?' for _ in range(len(COLUMNS) + 2))
+        updates = ', '.join(f'{name} = {name} + excluded.{name}' for name in ('events',) + COLUMNS)
+        conn.executemany(
+            f'INSERT INTO daily_metrics (day, events, {", ".join(COLUMNS)}) '
+            f'VALUES ({placeholders}) ON CONFLICT(day) DO UPDATE SET {updates}',
+            rows
+        )
+        conn.commit()
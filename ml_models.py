@@ -10,6 +10,11 @@ from sklearn.metrics import classification_report, silhouette_score
 import joblib
 import json
 from typing import Dict, List, Tuple, Any
+from itertools import islice, product
+from keyword_matcher import ARCHETYPE_KEYWORDS, default_matcher
+from loop_discovery import discover_loops
+from derived_metrics import CAUSE_TYPES, IMPACT_TYPES, LOOP_TYPES, derived_metrics
+from instrumentation import timed
 
 class CausalLoopMLModels:
     """Machine Learning models for causal loop analysis and pattern recognition"""
@@ -23,15 +28,10 @@ class CausalLoopMLModels:
         self.label_encoder = LabelEncoder()
         
         # System archetypes patterns
-        self.system_archetypes = {
-            'limits_to_growth': ['growth', 'limit', 'constraint', 'capacity', 'saturation'],
-            'tragedy_of_commons': ['shared', 'resource', 'depletion', 'overuse', 'competition'],
-            'escalation': ['competition', 'arms_race', 'retaliation', 'escalation', 'conflict'],
-            'fixes_that_fail': ['solution', 'unintended', 'consequence', 'side_effect', 'worsen'],
-            'shifting_the_burden': ['dependency', 'symptom', 'quick_fix', 'fundamental', 'weaken'],
-            'success_to_successful': ['advantage', 'resource_allocation', 'rich_get_richer', 'inequality']
-        }
+        self.system_archetypes = ARCHETYPE_KEYWORDS
+        self.keyword_matcher = default_matcher
         
+    @timed('extract_features')
     def extract_features(self, problems: List[Dict]) -> np.ndarray:
         """Extract features from problem data for ML analysis"""
         features = []
@@ -43,11 +43,13 @@ class CausalLoopMLModels:
             text_content = f"{problem.get('title', '')} {problem.get('description', '')}"
             
             # Count-based features
+            derived = derived_metrics(problem)
+            counts = derived['counts']
             feature_vector.extend([
-                len(problem.get('causes', [])),
-                len(problem.get('impacts', [])),
-                len(problem.get('feedback_loops', [])),
-                len(problem.get('remediations', [])),
+                counts['causes'],
+                counts['impacts'],
+                counts['feedback_loops'],
+                counts['remediations'],
                 len(text_content.split()),
                 text_content.count('reinforcing'),
                 text_content.count('balancing'),
@@ -60,52 +62,34 @@ class CausalLoopMLModels:
             ])
             
             # Type distribution features
-            causes = problem.get('causes', [])
-            impacts = problem.get('impacts', [])
-            feedback_loops = problem.get('feedback_loops', [])
-            
-            feature_vector.extend([
-                sum(1 for c in causes if c.get('type') == 'primary'),
-                sum(1 for c in causes if c.get('type') == 'secondary'),
-                sum(1 for c in causes if c.get('type') == 'latent'),
-                sum(1 for i in impacts if i.get('type') == 'technical'),
-                sum(1 for i in impacts if i.get('type') == 'business'),
-                sum(1 for i in impacts if i.get('type') == 'operational'),
-                sum(1 for i in impacts if i.get('type') == 'environmental'),
-                sum(1 for i in impacts if i.get('type') == 'health'),
-                sum(1 for i in impacts if i.get('type') == 'educational'),
-                sum(1 for fl in feedback_loops if fl.get('type') == 'reinforcing'),
-                sum(1 for fl in feedback_loops if fl.get('type') == 'balancing')
-            ])
+            feature_vector.extend(derived['cause_types'][t] for t in CAUSE_TYPES)
+            feature_vector.extend(derived['impact_types'][t] for t in IMPACT_TYPES)
+            feature_vector.extend(derived['loop_polarity'][t] for t in LOOP_TYPES)
             
             features.append(feature_vector)
         
         return np.array(features)
     
+    def archetype_labels(self, problems: List[Dict]) -> List[str]:
+        """Rule-based archetype labels used as training targets"""
+        return [
+            self.keyword_matcher.best_label(f"{problem.get('title', '')} {problem.get('description', '')}", 'archetype')
+            for problem in problems
+        ]
+    
+    @timed('fit', model='pattern_classifier')
     def train_pattern_classifier(self, problems: List[Dict]) -> Dict[str, Any]:
         """Train classifier to identify system archetypes"""
         if len(problems) < 10:
             return {"error": "Insufficient data for training"}
         
-        # Extract features
-        X = self.extract_features(problems)
-        
-        # Create labels based on content analysis
-        labels = []
-        for problem in problems:
-            text_content = f"{problem.get('title', '')} {problem.get('description', '')}".lower()
-            
-            # Simple rule-based labeling for training
-            label = 'unknown'
-            max_score = 0
-            
-            for archetype, keywords in self.system_archetypes.items():
-                score = sum(1 for keyword in keywords if keyword in text_content)
-                if score > max_score:
-                    max_score = score
-                    label = archetype
-            
-            labels.append(label)
+        # Extract features and label them by content analysis
+        return self.fit_pattern_classifier(self.extract_features(problems), self.archetype_labels(problems))
+    
+    def fit_pattern_classifier(self, X: np.ndarray, labels: List[str]) -> Dict[str, Any]:
+        """Fit the archetype classifier on already extracted features and labels"""
+        if len(labels) < 10:
+            return {"error": "Insufficient data for training"}
         
         # Encode labels
         y = self.label_encoder.fit_transform(labels)
@@ -143,6 +127,7 @@ class CausalLoopMLModels:
             ))
         }
     
+    @timed('predict', model='pattern_classifier')
     def predict_system_archetype(self, problem: Dict) -> Dict[str, Any]:
         """Predict system archetype for a given problem"""
         if self.pattern_classifier is None:
@@ -170,6 +155,21 @@ class CausalLoopMLModels:
             "probability_distribution": prob_dist
         }
     
+    @timed('predict', model='pattern_classifier')
+    def predict_system_archetypes(self, problems: List[Dict]) -> List[Dict[str, Any]]:
+        """Predict archetype and confidence for many problems in one model call"""
+        if self.pattern_classifier is None or not problems:
+            return []
+        
+        probabilities = self.pattern_classifier.predict_proba(self.scaler.transform(self.extract_features(problems)))
+        best = probabilities.argmax(axis=1)
+        labels = self.label_encoder.inverse_transform(self.pattern_classifier.classes_[best])
+        return [
+            {"predicted_archetype": label, "confidence": float(probabilities[i, best[i]])}
+            for i, label in enumerate(labels)
+        ]
+    
+    @timed('fit', model='anomaly_detector')
     def detect_anomalies(self, problems: List[Dict]) -> Dict[str, Any]:
         """Detect anomalous patterns in causal loop data"""
         if len(problems) < 5:
@@ -202,6 +202,7 @@ class CausalLoopMLModels:
             "total_analyzed": len(problems)
         }
     
+    @timed('fit', model='clustering')
     def cluster_similar_problems(self, problems: List[Dict]) -> Dict[str, Any]:
         """Cluster similar problems for pattern analysis"""
         if len(problems) < 3:
@@ -238,41 +239,54 @@ class CausalLoopMLModels:
             "n_clusters": n_clusters
         }
     
+    @timed('predict', model='loop_suggestions')
     def suggest_feedback_loops(self, problem: Dict) -> Dict[str, Any]:
         """Suggest potential feedback loops based on ML analysis"""
-        text_content = f"{problem.get('title', '')} {problem.get('description', '')}".lower()
+        # Prefer closed loops found in the signed cause/impact graph
+        result = discover_loops(problem)
+        if result['total_suggestions']:
+            return result
+        
+        # No closed loops: fall back to cause → impact pairs with matching polarity
+        result.update(self._suggest_loop_pairs(problem))
+        return result
+    
+    def _suggest_loop_pairs(self, problem: Dict) -> Dict[str, Any]:
+        """Suggest loops from cause/impact pairs whose wording implies a polarity"""
         causes = [c.get('description', '').lower() for c in problem.get('causes', [])]
         impacts = [i.get('description', '').lower() for i in problem.get('impacts', [])]
         
-        suggestions = []
-        
-        # Analyze cause-impact relationships
-        for cause in causes:
-            for impact in impacts:
-                # Check for reinforcing patterns
-                if any(word in cause for word in ['increase', 'grow', 'expand', 'improve']) and \
-                   any(word in impact for word in ['increase', 'grow', 'expand', 'improve']):
-                    suggestions.append({
-                        "type": "reinforcing",
-                        "description": f"Potential reinforcing loop: {cause} → {impact}",
-                        "confidence": 0.7
-                    })
-                
-                # Check for balancing patterns
-                if any(word in cause for word in ['increase', 'grow', 'expand']) and \
-                   any(word in impact for word in ['decrease', 'reduce', 'limit', 'constraint']):
-                    suggestions.append({
-                        "type": "balancing",
-                        "description": f"Potential balancing loop: {cause} → {impact}",
-                        "confidence": 0.6
-                    })
-        
-        # Sort by confidence
-        suggestions.sort(key=lambda x: x['confidence'], reverse=True)
+        # Scan every description once and bucket it by direction of change
+        cause_polarity = [self.keyword_matcher.scan(cause)['polarity'] for cause in causes]
+        impact_polarity = [self.keyword_matcher.scan(impact)['polarity'] for impact in impacts]
+        
+        rising_causes = [c for c, hits in zip(causes, cause_polarity) if hits.keys() & {'growth', 'improvement'}]
+        growing_causes = [c for c, hits in zip(causes, cause_polarity) if 'growth' in hits]
+        rising_impacts = [i for i, hits in zip(impacts, impact_polarity) if hits.keys() & {'growth', 'improvement'}]
+        falling_impacts = [i for i, hits in zip(impacts, impact_polarity) if 'decline' in hits]
+        
+        # Rising cause feeding a rising impact suggests a reinforcing loop;
+        # growth running into a decline suggests a balancing one
+        reinforcing = ({
+            "type": "reinforcing",
+            "description": f"Potential reinforcing loop: {cause} → {impact}",
+            "confidence": 0.7
+        } for cause, impact in product(rising_causes, rising_impacts))
+        balancing = ({
+            "type": "balancing",
+            "description": f"Potential balancing loop: {cause} → {impact}",
+            "confidence": 0.6
+        } for cause, impact in product(growing_causes, falling_impacts))
+        
+        # Reinforcing suggestions rank first, so only the top 5 pairs are materialized
+        suggestions = list(islice(reinforcing, 5))
+        suggestions.extend(islice(balancing, 5 - len(suggestions)))
+        total_suggestions = (len(rising_causes) * len(rising_impacts) +
+                             len(growing_causes) * len(falling_impacts))
         
         return {
-            "suggested_loops": suggestions[:5],  # Top 5 suggestions
-            "total_suggestions": len(suggestions)
+            "suggested_loops": suggestions,  # Top 5 suggestions
+            "total_suggestions": total_suggestions
         }
     
     def save_models(self, filepath: str = "ml_models.joblib"):
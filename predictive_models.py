@@ -1,13 +1,101 @@
 import numpy as np
-import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Any
-from datetime import datetime, timedelta
 import json
+from keyword_matcher import default_matcher
+from derived_metrics import derived_metrics
+from instrumentation import timed
+
+
+# Per-problem metrics tracked by the trend models, in storage column order
+TREND_METRICS = (
+    'causes_count', 'impacts_count', 'feedback_loops_count', 'remediations_count',
+    'complexity_score', 'reinforcing_loops', 'balancing_loops'
+)
+
+# Loop gains used by simulate_loop_dynamics (per unit time)
+SIMULATION_GROWTH_RATE = 0.05
+SIMULATION_DECAY_RATE = 0.03
+
+# Longest forecast horizon served, and how many distinct forecasts are kept
+MAX_FORECAST_DAYS = 365
+FORECAST_CACHE_SIZE = 32
+
+
+def forecast_horizon(days_ahead: Any) -> int:
+    """Clamp a requested horizon to 1..MAX_FORECAST_DAYS days"""
+    try:
+        days_ahead = int(days_ahead)
+    except (TypeError, ValueError):
+        days_ahead = 30
+    return min(max(days_ahead, 1), MAX_FORECAST_DAYS)
+
+
+def problem_trend_metrics(problem: Dict) -> Tuple[float, ...]:
+    """Return the TREND_METRICS values for a single problem"""
+    derived = derived_metrics(problem)
+    counts = derived['counts']
+    return (
+        counts['causes'],
+        counts['impacts'],
+        counts['feedback_loops'],
+        counts['remediations'],
+        derived['complexity_score'],
+        derived['loop_polarity']['reinforcing'],
+        derived['loop_polarity']['balancing']
+    )
+
+
+def impact_features(problem: Dict) -> List[float]:
+    """Cause, loop and complexity features used by the impact predictor"""
+    derived = derived_metrics(problem)
+    cause_types = derived['cause_types']
+    loop_polarity = derived['loop_polarity']
+    return [
+        derived['counts']['causes'],
+        cause_types['primary'],
+        cause_types['secondary'],
+        cause_types['latent'],
+        derived['counts']['feedback_loops'],
+        loop_polarity['reinforcing'],
+        loop_polarity['balancing'],
+        derived['complexity_score']
+    ]
+
+
+def _parse_days(values: List[str]) -> np.ndarray:
+    """Parse ISO-8601 timestamps into a datetime64[D] array, NaT where unparseable"""
+    # Casting to U10 keeps only the YYYY-MM-DD prefix, so the whole column
+    # converts in one vectorized call; time of day and offsets are irrelevant
+    # for daily buckets.
+    dates = np.asarray(values, dtype='U10')
+    try:
+        return dates.astype('datetime64[D]')
+    except ValueError:
+        parsed = np.empty(len(dates), dtype='datetime64[D]')
+        for i, value in enumerate(dates):
+            try:
+                parsed[i] = np.datetime64(value, 'D')
+            except ValueError:
+                parsed[i] = np.datetime64('NaT')
+        return parsed
+
+
+def _calendar_features(days: np.ndarray, origin: np.datetime64) -> np.ndarray:
+    """Build [day_of_week, month, quarter, days_since_start] rows for an array of days"""
+    day_index = days.astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so Monday == 0 like datetime.weekday()
+    day_of_week = (day_index + 3) % 7
+    month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    quarter = (month - 1) // 3 + 1
+    days_since_start = day_index - np.datetime64(origin, 'D').astype(np.int64)
+    return np.column_stack([day_of_week, month, quarter, days_since_start])
+
 
 class PredictiveAnalytics:
     """Predictive modeling for causal loop forecasting and simulation"""
@@ -17,82 +105,66 @@ class PredictiveAnalytics:
         self.impact_predictor = None
         self.loop_dynamics_model = None
         self.scaler = StandardScaler()
-        
-    def prepare_time_series_data(self, problems: List[Dict]) -> pd.DataFrame:
-        """Prepare time series data from historical problem data"""
-        data = []
-        
-        for problem in problems:
-            created_at = problem.get('created_at', '')
-            if created_at:
-                try:
-                    timestamp = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                except:
-                    timestamp = datetime.now()
-            else:
-                timestamp = datetime.now()
-            
-            # Extract metrics
-            data.append({
-                'timestamp': timestamp,
-                'problem_id': problem.get('id'),
-                'causes_count': len(problem.get('causes', [])),
-                'impacts_count': len(problem.get('impacts', [])),
-                'feedback_loops_count': len(problem.get('feedback_loops', [])),
-                'remediations_count': len(problem.get('remediations', [])),
-                'complexity_score': self._calculate_complexity_score(problem),
-                'reinforcing_loops': sum(1 for fl in problem.get('feedback_loops', []) 
-                                       if fl.get('type') == 'reinforcing'),
-                'balancing_loops': sum(1 for fl in problem.get('feedback_loops', []) 
-                                     if fl.get('type') == 'balancing')
-            })
-        
-        df = pd.DataFrame(data)
-        df = df.sort_values('timestamp')
-        return df
+        self.series_origin = None
+        self.series_end = None
+        self._forecast_cache = OrderedDict()
     
-    def _calculate_complexity_score(self, problem: Dict) -> float:
-        """Calculate complexity score for a problem"""
-        causes = problem.get('causes', [])
-        impacts = problem.get('impacts', [])
-        feedback_loops = problem.get('feedback_loops', [])
+    @timed('extract_features', model='time_series')
+    def prepare_time_series_data(self, problems: List[Dict]) -> Dict[str, np.ndarray]:
+        """Aggregate problem metrics into daily buckets keyed by creation date
         
-        # Weight different factors
-        score = 0
-        score += len(causes) * 1.0
-        score += len(impacts) * 0.8
-        score += len(feedback_loops) * 1.5
+        Each bucket holds the net change the day's new problems made to the
+        store, in the same shape as ``MetricsLog.daily_series``.
+        """
+        days = _parse_days([p.get('created_at') or '' for p in problems])
         
-        # Add complexity for different types
-        cause_types = set(c.get('type') for c in causes)
-        impact_types = set(i.get('type') for i in impacts)
-        score += len(cause_types) * 0.5
-        score += len(impact_types) * 0.3
+        # Problems without a usable timestamp are counted as created today
+        days[np.isnat(days)] = np.datetime64('today', 'D')
         
-        return score
-    
-    def train_time_series_models(self, problems: List[Dict]) -> Dict[str, Any]:
-        """Train time series models for trend forecasting"""
-        df = self.prepare_time_series_data(problems)
+        values = np.array([problem_trend_metrics(p) for p in problems], dtype=float)
+        values = values.reshape(len(problems), len(TREND_METRICS))
+        
+        # Bucket by day: per-day sum of every metric plus the number of problems
+        unique_days, bucket = np.unique(days, return_inverse=True)
         
-        if len(df) < 5:
+        series = {
+            'day': unique_days,
+            'problem_count': np.bincount(bucket, minlength=len(unique_days)).astype(float)
+        }
+        for column, name in enumerate(TREND_METRICS):
+            series[name] = np.bincount(bucket, weights=values[:, column], minlength=len(unique_days))
+        return series
+    
+    def _calculate_complexity_score(self, problem: Dict) -> float:
+        """Calculate complexity score for a problem"""
+        return derived_metrics(problem)['complexity_score']
+    
+    @timed('fit', model='time_series')
+    def train_time_series_models(self, problems: List[Dict] = None,
+                                 series: Dict[str, np.ndarray] = None) -> Dict[str, Any]:
+        """Train time series models for trend forecasting
+        
+        ``series`` is a pre-aggregated daily delta series (see
+        ``MetricsLog.daily_series``); when omitted it is rebuilt from the
+        problems' creation dates.
+        """
+        if series is None:
+            series = self.prepare_time_series_data(problems or [])
+        
+        if len(series['day']) == 0 or series['problem_count'].sum() < 5:
             return {"error": "Insufficient historical data"}
         
-        # Create features for time series
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        df['month'] = df['timestamp'].dt.month
-        df['quarter'] = df['timestamp'].dt.quarter
-        df['days_since_start'] = (df['timestamp'] - df['timestamp'].min()).dt.days
+        days = series['day']
+        origin = days[0]
+        features = ['day_of_week', 'month', 'quarter', 'days_since_start']
+        X = _calendar_features(days, origin)
         
-        # Train models for different metrics
+        # Train models for different metrics on the store totals at the end of each day
         metrics = ['causes_count', 'impacts_count', 'feedback_loops_count', 'complexity_score']
         models = {}
         
         for metric in metrics:
-            # Prepare features
-            features = ['day_of_week', 'month', 'quarter', 'days_since_start']
-            X = df[features].values
-            y = df[metric].values
+            y = np.cumsum(series[metric])
             
             # Train model
             model = RandomForestRegressor(n_estimators=50, random_state=42)
@@ -101,7 +173,7 @@ class PredictiveAnalytics:
             # Calculate performance
             y_pred = model.predict(X)
             mse = mean_squared_error(y, y_pred)
-            r2 = r2_score(y, y_pred)
+            r2 = r2_score(y, y_pred) if len(y) > 1 else 1.0
             
             models[metric] = {
                 'model': model,
@@ -111,90 +183,69 @@ class PredictiveAnalytics:
             }
         
         self.time_series_models = models
+        self.series_origin = origin
+        self.series_end = days[-1]
+        self._forecast_cache = OrderedDict()
         return {
             "models_trained": True,
             "metrics_trained": list(models.keys()),
+            "days_observed": len(days),
             "performance": {k: {'mse': v['mse'], 'r2': v['r2']} for k, v in models.items()}
         }
     
+    @timed('predict', model='time_series')
     def forecast_trends(self, days_ahead: int = 30) -> Dict[str, Any]:
         """Forecast future trends based on trained models"""
         if not self.time_series_models:
             return {"error": "Models not trained"}
         
-        forecasts = {}
-        last_date = datetime.now()
+        # Forecast from today, or from the last observed day if the data runs ahead of the clock
+        start = np.datetime64('today', 'D')
+        if self.series_end is not None:
+            start = max(start, self.series_end)
+        
+        days_ahead = forecast_horizon(days_ahead)
+        cache_key = (days_ahead, start)
+        if cache_key in self._forecast_cache:
+            self._forecast_cache.move_to_end(cache_key)
+            return self._forecast_cache[cache_key]
+        
+        origin = self.series_origin if self.series_origin is not None else start
+        horizon = start + np.arange(1, days_ahead + 1)
+        X = _calendar_features(horizon, origin)
+        dates = np.datetime_as_string(horizon).tolist()
         
+        forecasts = {}
         for metric, model_info in self.time_series_models.items():
-            model = model_info['model']
-            features = model_info['features']
-            
-            # Generate future dates
-            future_dates = [last_date + timedelta(days=i) for i in range(1, days_ahead + 1)]
-            
-            # Create features for future dates
-            future_features = []
-            for date in future_dates:
-                feature_row = [
-                    date.dayofweek,  # day_of_week
-                    date.month,      # month
-                    (date.month - 1) // 3 + 1,  # quarter
-                    (date - last_date).days  # days_since_start
-                ]
-                future_features.append(feature_row)
-            
-            # Make predictions
-            predictions = model.predict(future_features)
+            predictions = model_info['model'].predict(X)
             
             forecasts[metric] = {
-                'dates': [d.isoformat() for d in future_dates],
+                'dates': dates,
                 'predictions': predictions.tolist(),
                 'current_trend': 'increasing' if predictions[-1] > predictions[0] else 'decreasing'
             }
         
+        self._forecast_cache[cache_key] = forecasts
+        while len(self._forecast_cache) > FORECAST_CACHE_SIZE:
+            self._forecast_cache.popitem(last=False)
         return forecasts
     
+    @timed('fit', model='impact_predictor')
     def train_impact_predictor(self, problems: List[Dict]) -> Dict[str, Any]:
         """Train model to predict impacts based on causes and feedback loops"""
         if len(problems) < 10:
             return {"error": "Insufficient data for impact prediction"}
         
-        # Prepare training data
-        X = []
-        y = []
-        
-        for problem in problems:
-            features = []
-            
-            # Cause features
-            causes = problem.get('causes', [])
-            features.extend([
-                len(causes),
-                sum(1 for c in causes if c.get('type') == 'primary'),
-                sum(1 for c in causes if c.get('type') == 'secondary'),
-                sum(1 for c in causes if c.get('type') == 'latent')
-            ])
-            
-            # Feedback loop features
-            feedback_loops = problem.get('feedback_loops', [])
-            features.extend([
-                len(feedback_loops),
-                sum(1 for fl in feedback_loops if fl.get('type') == 'reinforcing'),
-                sum(1 for fl in feedback_loops if fl.get('type') == 'balancing')
-            ])
-            
-            # Complexity features
-            features.append(self._calculate_complexity_score(problem))
-            
-            # Target: number of impacts
-            target = len(problem.get('impacts', []))
-            
-            X.append(features)
-            y.append(target)
-        
-        # Train model
-        X = np.array(X)
-        y = np.array(y)
+        # Prepare training data: cause, loop and complexity features from the
+        # stored derived block; target is the number of impacts
+        X = np.array([impact_features(problem) for problem in problems], dtype=float)
+        y = np.array([derived_metrics(problem)['counts']['impacts'] for problem in problems])
+        return self.fit_impact_predictor(X, y)
+    
+    def fit_impact_predictor(self, X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+        """Fit the impact predictor on already extracted features and impact counts"""
+        if len(y) < 10:
+            return {"error": "Insufficient data for impact prediction"}
         
         X_scaled = self.scaler.fit_transform(X)
         
@@ -217,25 +268,14 @@ class PredictiveAnalytics:
             ))
         }
     
+    @timed('predict', model='impact_predictor')
     def predict_impacts(self, problem: Dict) -> Dict[str, Any]:
         """Predict number and type of impacts for a given problem"""
         if self.impact_predictor is None:
             return {"error": "Impact predictor not trained"}
         
         # Extract features
-        causes = problem.get('causes', [])
-        feedback_loops = problem.get('feedback_loops', [])
-        
-        features = [
-            len(causes),
-            sum(1 for c in causes if c.get('type') == 'primary'),
-            sum(1 for c in causes if c.get('type') == 'secondary'),
-            sum(1 for c in causes if c.get('type') == 'latent'),
-            len(feedback_loops),
-            sum(1 for fl in feedback_loops if fl.get('type') == 'reinforcing'),
-            sum(1 for fl in feedback_loops if fl.get('type') == 'balancing'),
-            self._calculate_complexity_score(problem)
-        ]
+        features = impact_features(problem)
         
         # Make prediction
         features_scaled = self.scaler.transform([features])
@@ -250,45 +290,25 @@ class PredictiveAnalytics:
             "predicted_types": impact_type_prediction
         }
     
+    @timed('predict', model='impact_predictor')
+    def predict_impact_counts(self, problems: List[Dict]) -> List[int]:
+        """Predict the number of impacts for many problems in one model call"""
+        if self.impact_predictor is None or not problems:
+            return []
+        
+        X = np.array([impact_features(problem) for problem in problems], dtype=float)
+        return np.rint(self.impact_predictor.predict(self.scaler.transform(X))).astype(int).tolist()
+    
     def _predict_impact_types(self, problem: Dict) -> Dict[str, float]:
         """Predict likely impact types based on problem characteristics"""
-        text_content = f"{problem.get('title', '')} {problem.get('description', '')}".lower()
-        causes = [c.get('description', '').lower() for c in problem.get('causes', [])]
+        text_content = f"{problem.get('title', '')} {problem.get('description', '')}"
         
-        # Simple rule-based prediction
+        # Simple rule-based prediction: 0.2 per distinct indicator keyword in the text
         impact_scores = {
-            'technical': 0.0,
-            'business': 0.0,
-            'operational': 0.0,
-            'environmental': 0.0,
-            'health': 0.0,
-            'educational': 0.0
+            impact_type: hits * 0.2
+            for impact_type, hits in default_matcher.label_scores(text_content, 'impact_type').items()
         }
         
-        # Technical indicators
-        tech_keywords = ['software', 'hardware', 'system', 'technology', 'data', 'network']
-        impact_scores['technical'] = sum(1 for kw in tech_keywords if kw in text_content) * 0.2
-        
-        # Business indicators
-        business_keywords = ['revenue', 'cost', 'profit', 'market', 'customer', 'sales']
-        impact_scores['business'] = sum(1 for kw in business_keywords if kw in text_content) * 0.2
-        
-        # Operational indicators
-        operational_keywords = ['process', 'workflow', 'efficiency', 'productivity', 'operation']
-        impact_scores['operational'] = sum(1 for kw in operational_keywords if kw in text_content) * 0.2
-        
-        # Environmental indicators
-        env_keywords = ['environment', 'pollution', 'energy', 'sustainability', 'climate']
-        impact_scores['environmental'] = sum(1 for kw in env_keywords if kw in text_content) * 0.2
-        
-        # Health indicators
-        health_keywords = ['health', 'safety', 'medical', 'patient', 'wellness']
-        impact_scores['health'] = sum(1 for kw in health_keywords if kw in text_content) * 0.2
-        
-        # Educational indicators
-        edu_keywords = ['education', 'learning', 'student', 'teacher', 'curriculum']
-        impact_scores['educational'] = sum(1 for kw in edu_keywords if kw in text_content) * 0.2
-        
         # Normalize scores
         total_score = sum(impact_scores.values())
         if total_score > 0:
@@ -299,6 +319,7 @@ class PredictiveAnalytics:
         
         return impact_scores
     
+    @timed('simulate')
     def simulate_loop_dynamics(self, problem: Dict, time_steps: int = 50) -> Dict[str, Any]:
         """Simulate the dynamic behavior of feedback loops over time"""
         feedback_loops = problem.get('feedback_loops', [])
@@ -318,8 +339,8 @@ class PredictiveAnalytics:
         
         # Simulation parameters
         dt = 0.1  # Time step
-        growth_rate = 0.05  # Growth rate for reinforcing loops
-        decay_rate = 0.03   # Decay rate for balancing loops
+        growth_rate = SIMULATION_GROWTH_RATE  # Growth rate for reinforcing loops
+        decay_rate = SIMULATION_DECAY_RATE    # Decay rate for balancing loops
         
         # Run simulation
         time_points = np.arange(0, time_steps * dt, dt)
@@ -403,7 +424,9 @@ class PredictiveAnalytics:
             'time_series_models': self.time_series_models,
             'impact_predictor': self.impact_predictor,
             'loop_dynamics_model': self.loop_dynamics_model,
-            'scaler': self.scaler
+            'scaler': self.scaler,
+            'series_origin': self.series_origin,
+            'series_end': self.series_end
         }
         joblib.dump(models, filepath)
     
@@ -415,6 +438,9 @@ class PredictiveAnalytics:
             self.impact_predictor = models.get('impact_predictor')
             self.loop_dynamics_model = models.get('loop_dynamics_model')
             self.scaler = models.get('scaler')
+            self.series_origin = models.get('series_origin')
+            self.series_end = models.get('series_end')
+            self._forecast_cache = OrderedDict()
             return True
         except FileNotFoundError:
             return False
@@ -0,0 +1,254 @@
+import heapq
+import html
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from derived_metrics import collection_items
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Relative importance of a hit in each indexed field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'description': 1.5,
+    'causes': 1.0,
+    'impacts': 1.0,
+    'feedback_loops': 1.0,
+    'remediations': 1.0
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in _TOKEN.findall(_text(text))]
+
+
+def _text(value: Any) -> str:
+    """Stored values as text; records edited outside the app may hold numbers or null"""
+    return '' if value is None else str(value)
+
+
+def revision(problem: Dict) -> Tuple[Any, Any]:
+    """What identifies one stored state of a problem; every writer changes it"""
+    return (problem.get('version'), problem.get('updated_at'))
+
+
+def _field_texts(problem: Dict) -> Dict[str, str]:
+    """Flatten a problem into one text per indexed field"""
+    def join(items, *keys):
+        parts = []
+        for item in items:
+            for key in keys:
+                value = item.get(key)
+                if isinstance(value, list):
+                    parts.extend(str(v) for v in value)
+                elif value:
+                    parts.append(str(value))
+        return '\n'.join(parts)
+    
+    return {
+        'title': _text(problem.get('title')),
+        'description': _text(problem.get('description')),
+        'causes': join(collection_items(problem, 'causes'), 'description'),
+        'impacts': join(collection_items(problem, 'impacts'), 'description'),
+        'feedback_loops': join(collection_items(problem, 'feedback_loops'), 'description', 'relationships'),
+        'remediations': join(collection_items(problem, 'remediations'), 'description')
+    }
+
+
+class SearchIndex:
+    """In-process inverted index over problem text with BM25 ranking
+    
+    Postings map each token to the field-weighted term frequency per
+    problem, so a query only touches the problems that contain its terms.
+    The last query term also matches as a prefix ("bott" finds
+    "bottleneck"), using a sorted vocabulary for the lookup.
+    
+    The index keeps no copy of the text: titles and snippets for a page of
+    results are built from the problems ``fetch`` returns by id.
+    """
+    
+    def __init__(self, fetch: Callable[[str], Optional[Dict]], k1: float = 1.2, b: float = 0.75):
+        self.fetch = fetch
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_tokens: Dict[str, List[str]] = {}
+        self._doc_length: Dict[str, float] = {}
+        self._doc_revision: Dict[str, Tuple[Any, Any]] = {}
+        self._total_length = 0.0
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_length)
+    
+    def rebuild(self, problems: List[Dict]):
+        """Replace the whole index"""
+        with self._lock:
+            self._postings.clear()
+            self._doc_tokens.clear()
+            self._doc_length.clear()
+            self._doc_revision.clear()
+            self._total_length = 0.0
+            for problem in problems:
+                self._add(problem)
+            self._vocabulary_dirty = True
+    
+    def add(self, problem: Dict):
+        """Index a problem, replacing any previous version of it"""
+        with self._lock:
+            self._remove(problem.get('id'))
+            self._add(problem)
+    
+    def sync(self, revisions: Dict[str, Tuple[Any, Any]], load: Callable[[str], Dict]) -> int:
+        """Bring the index in line with a store given as id -> ``revision``
+        
+        Problems that disappeared are dropped and only new or changed ones
+        are loaded and re-indexed. Returns the number of problems touched.
+        """
+        with self._lock:
+            stale = [doc_id for doc_id in self._doc_length if doc_id not in revisions]
+            changed = [doc_id for doc_id, rev in revisions.items() if self._doc_revision.get(doc_id) != rev]
+            for doc_id in stale:
+                self._remove(doc_id)
+            for doc_id in changed:
+                self._remove(doc_id)
+                self._add(load(doc_id))
+            return len(stale) + len(changed)
+    
+    def remove(self, problem_id: str):
+        with self._lock:
+            self._remove(problem_id)
+    
+    def _add(self, problem: Dict):
+        doc_id = problem.get('id')
+        if doc_id is None:
+            return
+        fields = _field_texts(problem)
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+        
+        for token, frequency in frequencies.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._vocabulary_dirty = True
+            postings[doc_id] = frequency
+        
+        self._doc_tokens[doc_id] = list(frequencies)
+        self._doc_length[doc_id] = length
+        self._doc_revision[doc_id] = revision(problem)
+        self._total_length += length
+    
+    def _remove(self, doc_id: Optional[str]):
+        if doc_id not in self._doc_length:
+            return
+        for token in self._doc_tokens.pop(doc_id):
+            postings = self._postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+        self._total_length -= self._doc_length.pop(doc_id)
+        del self._doc_revision[doc_id]
+    
+    def _expand_prefix(self, prefix: str, limit: int = 50) -> List[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, prefix)
+        matches = []
+        for token in self._vocabulary[start:start + limit]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+    
+    def search(self, query: str, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+        """Rank problems against ``query`` and return one page with highlights"""
+        started = time.perf_counter()
+        terms = tokenize(query)
+        page = max(1, page)
+        per_page = max(1, min(per_page, 100))
+        
+        with self._lock:
+            # Exact terms plus prefix completions of the last term
+            weighted_terms: Dict[str, float] = {term: 1.0 for term in terms}
+            if terms:
+                for token in self._expand_prefix(terms[-1]):
+                    weighted_terms.setdefault(token, 0.5)
+            
+            doc_count = len(self._doc_length)
+            average_length = self._total_length / doc_count if doc_count else 0.0
+            scores: Dict[str, float] = {}
+            for term, term_weight in weighted_terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_length[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + \
+                        term_weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+            
+            offset = (page - 1) * per_page
+            ranked = heapq.nsmallest(offset + per_page, scores.items(), key=lambda item: (-item[1], item[0]))
+        
+        # Text for the page only, fetched outside the lock; a problem deleted meanwhile is skipped
+        results = []
+        for doc_id, score in ranked[offset:offset + per_page]:
+            problem = self.fetch(doc_id)
+            if problem is None:
+                continue
+            fields = _field_texts(problem)
+            results.append({
+                'id': doc_id,
+                'title': fields['title'],
+                'score': round(score, 4),
+                'highlights': self._highlight(fields, weighted_terms)
+            })
+        
+        return {
+            'query': query,
+            'total': len(scores),
+            'page': page,
+            'per_page': per_page,
+            'results': results,
+            'took_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+    
+    def _highlight(self, fields: Dict[str, str], terms: Dict[str, float], width: int = 160) -> List[Dict[str, str]]:
+        """HTML-escaped snippets around the first hit in each matching field"""
+        highlights = []
+        for field, text in fields.items():
+            hits = [m for m in _TOKEN.finditer(text) if m.group().lower() in terms]
+            if not hits:
+                continue
+            start = max(0, hits[0].start() - width // 4)
+            end = min(len(text), start + width)
+            parts, cursor = [], start
+            for hit in hits:
+                if hit.start() < start:
+                    continue
+                if hit.end() > end:
+                    break
+                parts.append(html.escape(text[cursor:hit.start()]))
+                parts.append(f'<mark>{html.escape(hit.group())}</mark>')
+                cursor = hit.end()
+            parts.append(html.escape(text[cursor:end]))
+            snippet = ''.join(parts).replace('\n', ' · ')
+            highlights.append({
+                'field': field,
+                'snippet': ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+            })
+        return highlights
@@ -0,0 +1,134 @@
+import functools
+import json
+from typing import Any, Callable, Optional
+
+import numpy as np
+from flask import current_app, request
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Convert values neither backend serializes natively"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _plain_keys(obj: Any) -> Any:
+    """Copy of ``obj`` with NumPy scalar dict keys (e.g. cluster labels) made native"""
+    if isinstance(obj, dict):
+        return {(k.item() if isinstance(k, np.generic) else k): _plain_keys(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain_keys(v) for v in obj]
+    return obj
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes; compact unless ``indent``"""
+    if orjson is not None:
+        options = _OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, default=_default, option=options)
+        except TypeError:
+            # orjson rejects NumPy scalars as keys; normalize and retry once
+            return orjson.dumps(_plain_keys(obj), default=_default, option=options)
+    
+    options = dict(default=_default, ensure_ascii=False,
+                   indent=2 if indent else None, separators=None if indent else (',', ':'))
+    try:
+        text = json.dumps(obj, **options)
+    except TypeError:
+        text = json.dumps(_plain_keys(obj), **options)
+    return text.encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by :func:`dumps` and :func:`loads`"""
+    
+    mimetype = 'application/json'
+    
+    def dumps(self, obj: Any, **kwargs) -> str:
+        return dumps(obj).decode('utf-8')
+    
+    def loads(self, s: Any, **kwargs) -> Any:
+        return loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round trip the base class would do
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+class SocketIOJSON:
+    """``json``-module stand-in for python-socketio packet encoding"""
+    
+    @staticmethod
+    def dumps(obj: Any, *args, **kwargs) -> str:
+        return dumps(obj).decode('utf-8')
+    
+    @staticmethod
+    def loads(s: Any, *args, **kwargs) -> Any:
+        return loads(s)
+
+
+def conditional_read(etag_for: Callable[..., Optional[str]], cache_control: str,
+                     cacheable: Optional[Callable[[Any], bool]] = None):
+    """Serve a view with a strong ETag and answer matching If-None-Match with 304
+    
+    ``etag_for`` receives the view arguments and returns the validator, or
+    None when it cannot be known up front (e.g. a missing problem). The
+    check runs before the view, so unchanged reads skip both the work and
+    the serialization. A 200 response for which ``cacheable`` returns
+    False (e.g. an error body) goes out without the validator or caching.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = etag_for(*args, **kwargs)
+            if etag is not None and request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if etag is None or response.status_code != 200 or (cacheable and not cacheable(response)):
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Use the fast serializer for responses and answer conditional GETs on the API"""
+    app.json = FastJSONProvider(app)
+    
+    @app.after_request
+    def _conditional_get(response):
+        # Content-hash ETag for successful JSON reads; a matching If-None-Match gets 304
+        if request.method == 'GET' and response.status_code == 200 and response.is_json \
+                and not response.direct_passthrough and 'ETag' not in response.headers:
+            response.add_etag()
+            response.make_conditional(request)
+        return response
@@ -14,6 +14,7 @@ let customTemplates = [];
 let socket = null;
 let d3Visualizer = null;
 let mlModelsLoaded = false;
+let graphAnalytics = null;
 
 // Performance optimization variables
 let simulationInterval = null;
@@ -65,6 +66,10 @@ function initializeWebSocket() {
     socket.on('problem_added', function(data) {
         handleProblemAdded(data);
     });
+    
+    socket.on('problem_patched', function(data) {
+        handleProblemPatched(data);
+    });
 }
 
 // Initialize D3 visualizer
@@ -354,6 +359,103 @@ function handleProblemAdded(data) {
     showNotification('New problem added', 'info');
 }
 
+// Apply RFC 6902 operations (as normalized by the server) to a problem in place
+function applyJsonPatch(document, operations) {
+    const parse = pointer => pointer.split('/').slice(1).map(t => t.replace(/~1/g, '/').replace(/~0/g, '~'));
+    const parentOf = tokens => tokens.slice(0, -1).reduce((node, token) => node[token], document);
+    const get = tokens => tokens.reduce((node, token) => node[token], document);
+    const add = (tokens, value) => {
+        const parent = parentOf(tokens);
+        const key = tokens[tokens.length - 1];
+        if (Array.isArray(parent)) {
+            parent.splice(key === '-' ? parent.length : parseInt(key, 10), 0, value);
+        } else {
+            parent[key] = value;
+        }
+    };
+    const remove = tokens => {
+        const parent = parentOf(tokens);
+        const key = tokens[tokens.length - 1];
+        if (Array.isArray(parent)) {
+            return parent.splice(parseInt(key, 10), 1)[0];
+        }
+        const value = parent[key];
+        delete parent[key];
+        return value;
+    };
+    
+    operations.forEach(operation => {
+        const path = parse(operation.path);
+        switch (operation.op) {
+            case 'add':
+                add(path, JSON.parse(JSON.stringify(operation.value)));
+                break;
+            case 'remove':
+                remove(path);
+                break;
+            case 'replace':
+                remove(path);
+                add(path, JSON.parse(JSON.stringify(operation.value)));
+                break;
+            case 'move':
+                add(path, remove(parse(operation.from)));
+                break;
+            case 'copy':
+                add(path, JSON.parse(JSON.stringify(get(parse(operation.from)))));
+                break;
+        }
+    });
+}
+
+// Handle a delta from another collaborator
+function handleProblemPatched(data) {
+    const targets = [problems.find(p => p.id === data.problem_id)];
+    if (currentProblem && currentProblem.id === data.problem_id && !targets.includes(currentProblem)) {
+        targets.push(currentProblem);
+    }
+    
+    targets.filter(problem => problem).forEach(problem => {
+        if ((problem.version || 1) !== data.base_version) {
+            // Missed an earlier delta; fall back to a full reload
+            loadProblems();
+            return;
+        }
+        applyJsonPatch(problem, data.patch);
+        problem.version = data.version;
+        problem.updated_at = data.updated_at;
+    });
+    
+    displayProblems();
+    if (currentProblem && currentProblem.id === data.problem_id) {
+        displayCauses(currentProblem.causes || []);
+        displayImpacts(currentProblem.impacts || []);
+        displayLoops(currentProblem.feedback_loops || []);
+        displayRemediations(currentProblem.remediations || []);
+        createCausalDiagram(currentProblem);
+    }
+}
+
+// Send a delta for the current problem instead of the whole record
+async function patchProblem(problemId, operations) {
+    const response = await fetch(`/api/problems/${problemId}`, {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json-patch+json',
+            'X-Socket-Id': socket ? socket.id : ''
+        },
+        body: JSON.stringify({
+            patch: operations,
+            base_version: currentProblem && currentProblem.id === problemId ? (currentProblem.version || 1) : undefined
+        })
+    });
+    
+    const result = await response.json();
+    if (!response.ok) {
+        throw new Error(result.error || 'Failed to patch problem');
+    }
+    return result;
+}
+
 // Show notification
 function showNotification(message, type = 'info') {
     const notification = document.createElement('div');
@@ -1406,6 +1508,7 @@ function startSimulation() {
     simulationRunning = true;
     initializeBehaviorChart();
     createVariableControls();
+    loadGraphAnalytics(currentProblem.id);
     
     // Use requestAnimationFrame for smooth performance
     startOptimizedSimulationLoop();
@@ -1782,37 +1885,32 @@ function updateCurrentTime() {
     document.getElementById('currentTime').textContent = `T${currentTimeStep}`;
 }
 
-// Update system metrics
-function updateSystemMetrics() {
-    if (!simulationData.variables) return;
-    
-    const values = Object.values(simulationData.variables).map(v => v.value);
-    const avgValue = values.reduce((a, b) => a + b, 0) / values.length;
-    const variance = values.reduce((a, b) => a + Math.pow(b - avgValue, 2), 0) / values.length;
-    const stdDev = Math.sqrt(variance);
-    
-    // Calculate growth rate
-    let growthRate = 0;
-    if (currentTimeStep > 1) {
-        Object.values(simulationData.variables).forEach(variable => {
-            if (variable.history.length > 1) {
-                const prev = variable.history[variable.history.length - 2];
-                const curr = variable.value;
-                growthRate += ((curr - prev) / prev) * 100;
-            }
-        });
-        growthRate /= Object.keys(simulationData.variables).length;
-    }
+// Fetch server-side graph analytics (centrality, components, loop dominance)
+async function loadGraphAnalytics(problemId) {
+    if (!problemId) return;
     
-    // Update metrics display
-    document.getElementById('stabilityMetric').textContent = stdDev < 10 ? 'Stable' : stdDev < 20 ? 'Moderate' : 'Volatile';
-    document.getElementById('growthMetric').textContent = `${growthRate.toFixed(1)}%`;
+    try {
+        const response = await fetch(`/api/analytics/graph/${problemId}`);
+        const result = await response.json();
+        
+        if (!result.error) {
+            graphAnalytics = result;
+            updateSystemMetrics();
+        }
+    } catch (error) {
+        console.error('Error loading graph analytics:', error);
+    }
+}
+
+// Update system metrics from the server-side eigenvalue analysis
+function updateSystemMetrics() {
+    if (!graphAnalytics || !currentProblem || graphAnalytics.problem_id !== currentProblem.id) return;
     
-    // Determine loop dominance
-    const reinforcingCount = (currentProblem.feedback_loops || []).filter(l => l.type === 'reinforcing').length;
-    const balancingCount = (currentProblem.feedback_loops || []).filter(l => l.type === 'balancing').length;
-    const dominance = reinforcingCount > balancingCount ? 'Reinforcing' : balancingCount > reinforcingCount ? 'Balancing' : 'Balanced';
-    document.getElementById('dominanceMetric').textContent = dominance;
+    const metrics = graphAnalytics.system_metrics;
+    const label = value => value.charAt(0).toUpperCase() + value.slice(1);
+    document.getElementById('stabilityMetric').textContent = label(metrics.stability);
+    document.getElementById('growthMetric').textContent = `${metrics.growth_rate.toFixed(1)}%`;
+    document.getElementById('dominanceMetric').textContent = label(metrics.dominance);
 }
 
 // Update node visualization
@@ -3339,11 +3437,22 @@ function addSuggestedLoop(index) {
     }
     
     // Add the suggested loop
-    currentProblem.feedback_loops.push({
+    const loop = {
         description: suggestion.description,
         type: suggestion.type,
-        relationships: [suggestion.description]
-    });
+        relationships: suggestion.relationships || [suggestion.description]
+    };
+    currentProblem.feedback_loops.push(loop);
+    
+    // Persist just the new loop for saved problems
+    if (currentProblem.id) {
+        patchProblem(currentProblem.id, [{ op: 'append', collection: 'feedback_loops', value: loop }])
+            .then(result => {
+                currentProblem.version = result.version;
+                currentProblem.updated_at = result.updated_at;
+            })
+            .catch(error => console.error('Error saving suggested loop:', error));
+    }
     
     // Update display
     displayLoops(currentProblem.feedback_loops);
@@ -8,6 +8,8 @@ class D3CausalLoopVisualizer {
         this.simulation = null;
         this.nodes = [];
         this.links = [];
+        // True while nodes sit at server-computed positions and the simulation is idle
+        this.presetLayout = false;
         this.colorScale = d3.scaleOrdinal(d3.schemeCategory10);
         
         this.init();
@@ -55,7 +57,7 @@ class D3CausalLoopVisualizer {
             .force('collision', d3.forceCollide().radius(30));
     }
     
-    loadData(problem) {
+    async loadData(problem) {
         // Convert problem data to D3 format
         this.nodes = [];
         this.links = [];
@@ -141,9 +143,61 @@ class D3CausalLoopVisualizer {
             });
         });
         
+        // Saved problems get their positions from the server's cached layout
+        this.presetLayout = false;
+        const layout = problem.id ? await this.fetchLayout(problem.id) : null;
+        if (layout) {
+            this.applyLayout(layout, problem);
+        }
+        
+        // Loop relationships name nodes by description; keep only links with both ends drawn
+        const nodeIds = new Set(this.nodes.map(d => d.id));
+        this.links = this.links.filter(l => nodeIds.has(l.source) && nodeIds.has(l.target));
+        
         this.render();
     }
     
+    async fetchLayout(problemId) {
+        try {
+            const response = await fetch(`/api/problems/${encodeURIComponent(problemId)}/layout`);
+            if (!response.ok) return null;
+            return await response.json();
+        } catch (error) {
+            console.error('Error loading diagram layout:', error);
+            return null;
+        }
+    }
+    
+    applyLayout(layout, problem) {
+        // Centre the layout's bounding box in the view
+        const { min_x, min_y, max_x, max_y } = layout.bounds;
+        const dx = this.width / 2 - (min_x + max_x) / 2;
+        const dy = this.height / 2 - (min_y + max_y) / 2;
+        const positions = new Map(layout.nodes.map(n => [n.id, n]));
+        
+        let placed = 0;
+        this.nodes.forEach(node => {
+            const position = positions.get(node.id);
+            if (position) {
+                node.x = position.x + dx;
+                node.y = position.y + dy;
+                placed++;
+            }
+        });
+        
+        // The server's links only describe the diagram it laid out; with unsaved
+        // local edits keep the links built here and use the positions as seeds
+        this.presetLayout = placed === this.nodes.length && layout.version === problem.version;
+        if (this.presetLayout) {
+            this.links = layout.links.map(l => ({
+                source: l.source,
+                target: l.target,
+                type: l.type,
+                strength: l.type === 'causal' ? 1.0 : l.type === 'membership' ? 0.3 : 0.8
+            }));
+        }
+    }
+    
     render() {
         // Clear existing elements
         this.g.selectAll('*').remove();
@@ -157,6 +211,7 @@ class D3CausalLoopVisualizer {
             .attr('stroke', d => d.type === 'reinforcing' ? '#2ecc71' : 
                               d.type === 'balancing' ? '#e74c3c' : '#95a5a6')
             .attr('stroke-width', d => Math.max(1, d.strength * 3))
+            .attr('stroke-dasharray', d => d.type === 'membership' ? '4,4' : null)
             .attr('marker-end', d => `url(#arrow-${d.type})`)
             .style('opacity', 0.8);
         
@@ -212,7 +267,7 @@ class D3CausalLoopVisualizer {
         this.simulation.nodes(this.nodes);
         this.simulation.force('link').links(this.links);
         
-        this.simulation.on('tick', () => {
+        this.ticked = () => {
             link
                 .attr('x1', d => d.source.x)
                 .attr('y1', d => d.source.y)
@@ -220,13 +275,20 @@ class D3CausalLoopVisualizer {
                 .attr('y2', d => d.target.y);
             
             node.attr('transform', d => `translate(${d.x},${d.y})`);
-        });
-        
-        this.simulation.alpha(1).restart();
+        };
+        this.simulation.on('tick', this.ticked);
+        
+        if (this.presetLayout) {
+            // Already settled on the server: draw once, no simulation
+            this.simulation.stop();
+            this.ticked();
+        } else {
+            this.simulation.alpha(1).restart();
+        }
     }
     
     dragstarted(event, d) {
-        if (!event.active) this.simulation.alphaTarget(0.3).restart();
+        if (!event.active && !this.presetLayout) this.simulation.alphaTarget(0.3).restart();
         d.fx = d.x;
         d.fy = d.y;
     }
@@ -234,10 +296,16 @@ class D3CausalLoopVisualizer {
     dragged(event, d) {
         d.fx = event.x;
         d.fy = event.y;
+        if (this.presetLayout) {
+            // Move just the dragged node; the rest of the layout stays put
+            d.x = event.x;
+            d.y = event.y;
+            this.ticked();
+        }
     }
     
     dragended(event, d) {
-        if (!event.active) this.simulation.alphaTarget(0);
+        if (!event.active && !this.presetLayout) this.simulation.alphaTarget(0);
         d.fx = null;
         d.fy = null;
     }
@@ -446,6 +514,7 @@ class D3CausalLoopVisualizer {
         if (params.collisionRadius !== undefined) {
             this.simulation.force('collision').radius(params.collisionRadius);
         }
+        this.presetLayout = false;
         this.simulation.alpha(1).restart();
     }
     